@@ -0,0 +1,225 @@
+"""
+Aggregation pipelines for department and admin analytics
+"""
+from datetime import datetime, UTC, timedelta
+
+# Statuses reported in the department status distribution
+ANALYTICS_STATUSES = ('pending', 'in_progress', 'resolved', 'rejected')
+
+# Number of calendar months in the department trend chart
+TREND_MONTHS = 6
+
+
+def _count_if(condition):
+    return {'$sum': {'$cond': [condition, 1, 0]}}
+
+
+def _percent(part, whole):
+    return round((part / whole) * 100, 1) if whole > 0 else 0
+
+
+def trend_months(now, count=TREND_MONTHS):
+    """First instant (UTC) of each of the last `count` calendar months, oldest first"""
+    months = []
+    year, month = now.year, now.month
+    for _ in range(count):
+        months.append(datetime(year, month, 1, tzinfo=UTC))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(months))
+
+
+def department_analytics_pipeline(dept_name, start_date, prev_start, trend_start):
+    """One pass over a department's petitions producing every analytics metric"""
+    in_period = {'$gte': ['$created_at', start_date]}
+    is_resolved = {'$eq': ['$status', 'resolved']}
+
+    return [
+        {'$match': {'department': dept_name}},
+        {'$facet': {
+            'periods': [
+                {'$match': {'created_at': {'$gte': prev_start}}},
+                {'$group': {
+                    '_id': None,
+                    'total': _count_if(in_period),
+                    'resolved': _count_if({'$and': [in_period, is_resolved]}),
+                    'prev_total': _count_if({'$lt': ['$created_at', start_date]}),
+                    'prev_resolved': _count_if({'$and': [{'$lt': ['$created_at', start_date]}, is_resolved]})
+                }}
+            ],
+            'status': [
+                {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+            ],
+            'categories': [
+                {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1, '_id': 1}},
+                {'$limit': 5}
+            ],
+            'trend': [
+                {'$match': {'created_at': {'$gte': trend_start}}},
+                {'$group': {
+                    '_id': {'$dateTrunc': {'date': '$created_at', 'unit': 'month', 'timezone': 'UTC'}},
+                    'submitted': {'$sum': 1},
+                    'resolved': _count_if(is_resolved)
+                }}
+            ],
+            'flags': [
+                {'$group': {
+                    '_id': None,
+                    'high_urgency': _count_if({'$eq': ['$urgency', 'high']}),
+                    'reopened': _count_if({'$and': [
+                        {'$eq': ['$status', 'in_progress']},
+                        {'$ne': [{'$type': '$updated_at'}, 'missing']}
+                    ]})
+                }}
+            ]
+        }}
+    ]
+
+
+def department_analytics(db, dept_name, days=30, now=None):
+    """Analytics payload for /api/department/analytics from a single aggregation"""
+    now = now or datetime.now(UTC)
+    start_date = now - timedelta(days=days)
+    prev_start = start_date - timedelta(days=days)
+    months = trend_months(now)
+
+    result = next(db.petitions.aggregate(
+        department_analytics_pipeline(dept_name, start_date, prev_start, months[0])
+    ), {})
+
+    periods = (result.get('periods') or [{}])[0]
+    flags = (result.get('flags') or [{}])[0]
+
+    total_petitions = periods.get('total', 0)
+    prev_petitions = periods.get('prev_total', 0)
+    resolved_petitions = periods.get('resolved', 0)
+    prev_resolved = periods.get('prev_resolved', 0)
+
+    petition_trend = 0
+    if prev_petitions > 0:
+        petition_trend = round(((total_petitions - prev_petitions) / prev_petitions) * 100, 1)
+
+    resolution_rate = _percent(resolved_petitions, total_petitions)
+    prev_resolution_rate = _percent(prev_resolved, prev_petitions)
+    resolution_trend = round(resolution_rate - prev_resolution_rate, 1)
+
+    status_found = {item['_id']: item['count'] for item in result.get('status', [])}
+    status_counts = {status: status_found.get(status, 0) for status in ANALYTICS_STATUSES}
+
+    # Buckets come back as naive UTC datetimes; key them by (year, month)
+    buckets = {(item['_id'].year, item['_id'].month): item for item in result.get('trend', [])}
+    trend_data = []
+    for month_start in months:
+        bucket = buckets.get((month_start.year, month_start.month), {})
+        trend_data.append({
+            'month': month_start.strftime('%b'),
+            'submitted': bucket.get('submitted', 0),
+            'resolved': bucket.get('resolved', 0)
+        })
+
+    return {
+        'metrics': {
+            'total_petitions': total_petitions,
+            'petition_trend': petition_trend,
+            'resolution_rate': resolution_rate,
+            'resolution_trend': resolution_trend,
+            'avg_response_time': 2.3,  # Can be calculated from actual data
+            'response_trend': -0.5,
+            'satisfaction_score': 4.2,  # Can be from user ratings
+            'satisfaction_trend': 0.3
+        },
+        'status_distribution': status_counts,
+        'category_distribution': [
+            {'name': cat['_id'], 'count': cat['count']} for cat in result.get('categories', [])
+        ],
+        'trend_data': trend_data,
+        'performance': {
+            'first_response': '1.8h',
+            'sla_compliance': 95,
+            'escalated_cases': flags.get('high_urgency', 0),
+            'reopened_petitions': flags.get('reopened', 0)
+        }
+    }
+
+
+def admin_stats_pipeline(first_day, recent_start):
+    """One pass over all petitions for the admin dashboard totals"""
+    is_pending = {'$eq': ['$status', 'pending']}
+    is_resolved = {'$eq': ['$status', 'resolved']}
+
+    return [
+        {'$facet': {
+            'status': [
+                {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+            ],
+            'departments': [
+                {'$group': {
+                    '_id': '$department',
+                    'total': {'$sum': 1},
+                    'pending': _count_if(is_pending),
+                    'resolved': _count_if(is_resolved)
+                }}
+            ],
+            'daily': [
+                {'$match': {'created_at': {'$gte': first_day}}},
+                {'$group': {
+                    '_id': {'$dateTrunc': {'date': '$created_at', 'unit': 'day', 'timezone': 'UTC'}},
+                    'total': {'$sum': 1},
+                    'pending': _count_if(is_pending),
+                    'resolved': _count_if(is_resolved)
+                }}
+            ],
+            'recent': [
+                {'$match': {'created_at': {'$gte': recent_start}}},
+                {'$count': 'count'}
+            ]
+        }}
+    ]
+
+
+def admin_stats(db, now=None):
+    """Payload for /api/admin/stats without loading petitions or users into memory"""
+    now = now or datetime.now(UTC)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+
+    result = next(db.petitions.aggregate(admin_stats_pipeline(days[0], now - timedelta(days=30))), {})
+
+    status_counts = {item['_id']: item['count'] for item in result.get('status', [])}
+    by_department = {item['_id']: item for item in result.get('departments', [])}
+    by_day = {item['_id'].date(): item for item in result.get('daily', [])}
+    recent = (result.get('recent') or [{}])[0]
+
+    department_names = [dept['name'] for dept in db.departments.find({}, {'name': 1})]
+    dept_stats = {}
+    for dept_name in department_names:
+        item = by_department.get(dept_name, {})
+        dept_stats[dept_name] = {
+            'total': item.get('total', 0),
+            'pending': item.get('pending', 0),
+            'resolved': item.get('resolved', 0)
+        }
+
+    daily_stats = []
+    for day in days:
+        item = by_day.get(day.date(), {})
+        daily_stats.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'total': item.get('total', 0),
+            'pending': item.get('pending', 0),
+            'resolved': item.get('resolved', 0)
+        })
+
+    return {
+        'total_petitions': sum(status_counts.values()),
+        'pending': status_counts.get('pending', 0),
+        'in_progress': status_counts.get('in_progress', 0),
+        'resolved': status_counts.get('resolved', 0),
+        'total_users': db.users.estimated_document_count(),
+        'total_departments': len(department_names),
+        'department_stats': dept_stats,
+        'daily_stats': daily_stats,
+        'recent_petitions_count': recent.get('count', 0)
+    }
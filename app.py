@@ -1,10 +1,32 @@
-from flask import Flask, request, jsonify, session, render_template
+from flask import Flask, request, jsonify, session, render_template, Response, stream_with_context
 from flask_cors import CORS
-from models import User, Petition, Department, Admin
+from models import (
+    User, Petition, Department, Admin, MAX_PAGE_SIZE, OPEN_STATUSES,
+    decode_cursor, next_cursor, resolve_projection
+)
 from config import Config
-from pymongo import MongoClient
+from database import db, get_pool_stats
+from indexes import ensure_indexes, index_report, print_index_report
+from analytics import department_analytics as build_department_analytics, admin_stats
+from reports import daily_reports, weekly_reports
+from counters import (
+    move_status, get_status_counts, rebuild_counters, delete_department_counters, migrate_counters,
+    mark_counters_migrated
+)
+from deadlines import DeadlineScheduler, MISSED_OVERDUE
+from principals import PrincipalCache
+from notifications import (
+    create_notification, list_notifications, count_unread, mark_read, mark_all_read,
+    serialize_notification, publish_event, rebuild_unread_counters, format_event, NOTIFICATION_PAGE_SIZE,
+    broker as notification_broker
+)
+from search import (
+    search_petitions as ranked_search, search_facets, faceted_search, parse_date_bound,
+    SEARCH_PAGE_SIZE, SEARCH_SORTS
+)
 import google.generativeai as genai
 import os
+import threading
 from datetime import datetime, UTC, timedelta
 import json
 from bson import ObjectId
@@ -16,20 +38,13 @@ from email_utils import (
     get_welcome_email_template,
     send_petition_submission_email,
     send_petition_status_update_email,
-    send_email
+    send_templated_email,
+    send_templated_emails,
+    send_digest_email,
+    pick_fields,
+    email_dispatcher
 )
-from email_templates import (
-    get_high_urgency_alert_template,
-    get_daily_summary_template,
-    get_weekly_report_template,
-    get_deadline_reminder_template
-)
-
-client = MongoClient(Config.MONGO_URI)
-db = client.petition_system
-
-# Notifications storage (in-memory for now, could be MongoDB collection)
-notifications_store = []
+from email_outbox import retry_dead_letters
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -50,6 +65,145 @@ class JSONEncoder(json.JSONEncoder):
 
 app.json_encoder = JSONEncoder
 
+# Startup migrations
+def run_startup_migrations(build_indexes=True):
+    """Build any declared index that is missing, and the department counters
+    on a database that predates them (safe to run on every start)"""
+    if build_indexes:
+        try:
+            created = ensure_indexes(db)
+            print(f"🗂️ Startup index migration complete ({len(created)} created)")
+        except Exception as e:
+            print(f"⚠️ Startup index migration failed: {str(e)}")
+    try:
+        written = migrate_counters(db)
+        if written is not None:
+            departments = rebuild_unread_counters(db)
+            print(f"🗂️ Counter migration complete ({written} petition counters, {departments} departments with unread)")
+    except Exception as e:
+        print(f"⚠️ Counter migration failed, run `flask --app app rebuild-counters`: {str(e)}")
+
+# Run in the background so a slow index build never delays serving requests
+threading.Thread(
+    target=run_startup_migrations,
+    args=(getattr(Config, 'AUTO_ENSURE_INDEXES', True),),
+    daemon=True
+).start()
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create any missing indexes declared in indexes.py"""
+    created = ensure_indexes(db)
+    print(f"✅ Index migration complete ({len(created)} created)")
+
+@app.cli.command('index-report')
+def index_report_command():
+    """Show missing and unused indexes"""
+    print_index_report(index_report(db))
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute per-department petition and unread notification counters"""
+    written = rebuild_counters(db)
+    mark_counters_migrated(db)
+    print(f"✅ Rebuilt {written} petition counters")
+    departments = rebuild_unread_counters(db)
+    print(f"✅ Rebuilt unread notification counters ({departments} departments with unread)")
+
+# Pagination helpers
+DEFAULT_PAGE_SIZE = getattr(Config, 'PETITION_PAGE_SIZE', 50)
+
+def get_page_args():
+    """Read optional `limit` and `cursor` query parameters for petition lists.
+
+    Without either, callers get the full list as before. Raises ValueError for
+    a malformed limit or cursor.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor') or None
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError('limit must be a positive integer')
+        limit = min(limit, MAX_PAGE_SIZE)
+    elif cursor:
+        limit = DEFAULT_PAGE_SIZE
+    if cursor:
+        decode_cursor(cursor)
+    return limit, cursor
+
+# Session principals (users, departments, admins) cached per process
+principals = PrincipalCache(
+    db,
+    maxsize=getattr(Config, 'PRINCIPAL_CACHE_SIZE', 1024),
+    ttl=getattr(Config, 'PRINCIPAL_CACHE_TTL', 30)
+)
+
+# Petition fields the deadline reminder template shows
+REMINDER_FIELDS = ('ticket_id', 'title', 'category', 'urgency', 'status', 'full_name', 'department')
+
+# Petition fields the rejection template shows
+REJECTION_FIELDS = ('ticket_id', 'title', 'category', 'department', 'full_name', 'created_at')
+
+# A petition is reminded about at most once per interval by the reminder route
+DEADLINE_REMINDER_INTERVAL = timedelta(hours=getattr(Config, 'DEADLINE_REMINDER_INTERVAL_HOURS', 24))
+
+# Scheduled reminders for one department within this window go out as a
+# single digest; 0 sends one email per petition
+DEADLINE_DIGEST_WINDOW = timedelta(minutes=getattr(Config, 'DEADLINE_DIGEST_WINDOW_MINUTES', 15))
+
+# Escalations missed while the scheduler was down arrive together on startup;
+# they are always digested, per department, for at least this long
+MISSED_ESCALATION_WINDOW = max(DEADLINE_DIGEST_WINDOW, timedelta(minutes=1))
+
+# Deadline events
+def handle_deadline_event(event, petition):
+    """Email the owning department when a petition crosses a deadline threshold"""
+    department = db.departments.find_one({'name': petition.get('department')})
+    if not department or not department.get('email'):
+        print(f"⚠️ No department email for {petition.get('department')} ({petition.get('ticket_id')})")
+        return
+    
+    deadline = petition['deadline']
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=UTC)
+    hours_remaining = (deadline - datetime.now(UTC)).total_seconds() / 3600
+    context = {'petition_data': pick_fields(petition, REMINDER_FIELDS), 'hours_remaining': hours_remaining}
+    
+    if event == MISSED_OVERDUE:
+        item = {'petition_data': pick_fields(petition, REMINDER_FIELDS), 'deadline': petition['deadline']}
+        recipients = [department['email']] + [admin['email'] for admin in db.admins.find({}, {'email': 1}) if admin.get('email')]
+        for recipient in recipients:
+            send_digest_email(recipient, 'deadline_digest', f"missed_escalation:{department['name']}", item,
+                              MISSED_ESCALATION_WINDOW,
+                              context={'department_name': department['name'], 'escalation': True}, lane='alert')
+        print(f"⏰ Missed escalation for {petition.get('ticket_id')} added to the {department['name']} escalation digest")
+        return
+    
+    if event != 'overdue' and DEADLINE_DIGEST_WINDOW:
+        item = {'petition_data': pick_fields(petition, REMINDER_FIELDS), 'deadline': petition['deadline']}
+        send_digest_email(department['email'], 'deadline_digest', 'deadline_reminder', item, DEADLINE_DIGEST_WINDOW,
+                          context={'department_name': department['name']}, lane='alert')
+        print(f"⏰ {event} for {petition.get('ticket_id')} added to the {department['name']} reminder digest")
+        return
+    
+    if event == 'overdue':
+        # Escalate at once: the department and every admin hear about it
+        subject = f"🚨 Overdue Petition Escalation: {petition.get('ticket_id')}"
+        recipients = [department['email']] + [admin['email'] for admin in db.admins.find({}, {'email': 1}) if admin.get('email')]
+    else:
+        subject = f"⚠️ Deadline Reminder: Petition {petition.get('ticket_id')}"
+        recipients = [department['email']]
+    
+    for recipient in recipients:
+        send_templated_email(recipient, subject, 'deadline_reminder', context)
+    print(f"⏰ {event} sent for {petition.get('ticket_id')} to {', '.join(recipients)}")
+
+deadline_scheduler = DeadlineScheduler(
+    db, handle_deadline_event, enabled=getattr(Config, 'DEADLINE_SCHEDULER_ENABLED', True)
+)
+deadline_scheduler.start()
+
 # AI Assistant Functions
 def improve_petition_text(text, title, category):
     prompt = f"""
@@ -315,6 +469,7 @@ def verify_otp():
                 }
             }
         )
+        principals.invalidate_user(user['_id'])
         
         # Send welcome email
         send_welcome_email(email, user['name'])
@@ -425,6 +580,7 @@ def create_petition():
             attachments=data.get('attachments', [])
         )
         result = petition.save()
+        deadline_scheduler.schedule(petition.ticket_id, petition.deadline)
         
         # Send submission confirmation email to user
         send_petition_submission_email(
@@ -435,18 +591,10 @@ def create_petition():
         )
         print(f"📧 Petition submission email queued for user: {petition.email}")
         
-        # Add notification to store
-        notification = {
-            'id': str(ObjectId()),
-            'ticket_id': petition.ticket_id,
-            'title': petition.title,
-            'department': petition.department,
-            'urgency': petition.urgency,
-            'type': 'new_petition',
-            'timestamp': datetime.now(UTC).isoformat(),
-            'read': False
-        }
-        notifications_store.append(notification)
+        # Notify the department
+        create_notification(
+            db, petition.department, 'new_petition', petition.ticket_id, petition.title, petition.urgency
+        )
         print(f"🔔 Notification added for department: {petition.department}")
         
         # If high urgency, send email alert to department
@@ -465,11 +613,11 @@ def create_petition():
                     'created_at': datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S')
                 }
                 
-                html_content = get_high_urgency_alert_template(petition_data)
-                send_email(
+                send_templated_email(
                     to_email=dept['email'],
                     subject=f"🚨 HIGH URGENCY PETITION - {petition.ticket_id}",
-                    html_body=html_content
+                    template='high_urgency_alert',
+                    context={'petition_data': petition_data}
                 )
                 print(f"🚨 High urgency email sent to department: {dept['email']}")
         
@@ -483,8 +631,17 @@ def create_petition():
 @app.route('/api/petitions/user/<user_id>')
 def get_user_petitions(user_id):
     try:
-        petitions = Petition.find_by_user(user_id)
-        return jsonify({'petitions': petitions}), 200
+        try:
+            limit, cursor = get_page_args()
+            projection = resolve_projection(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        petitions = Petition.find_by_user(user_id, limit=limit, cursor=cursor, projection=projection)
+        return jsonify({
+            'petitions': petitions,
+            'next_cursor': next_cursor(petitions, limit)
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -691,6 +848,9 @@ def create_department():
         
         result = department.save()
         
+        # Petitions may already reference this department name
+        rebuild_counters(db, department=department.name)
+        
         print(f"✅ Department created: {data['dept_name']}")
         
         return jsonify({
@@ -709,15 +869,13 @@ def get_department(dept_id):
         if 'admin_id' not in session:
             return jsonify({'error': 'Unauthorized'}), 401
         
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
         # Get petition statistics for this department
-        total_petitions = db.petitions.count_documents({'department': department['name']})
-        pending_petitions = db.petitions.count_documents({'department': department['name'], 'status': 'pending'})
-        resolved_petitions = db.petitions.count_documents({'department': department['name'], 'status': 'resolved'})
+        counts = get_status_counts(db, department['name'])
         
         dept_data = {
             'id': str(department['_id']),
@@ -728,9 +886,9 @@ def get_department(dept_id):
             'phone': department.get('phone'),
             'address': department.get('address'),
             'created_at': department.get('created_at'),
-            'total_petitions': total_petitions,
-            'pending_petitions': pending_petitions,
-            'resolved_petitions': resolved_petitions
+            'total_petitions': counts['total'],
+            'pending_petitions': counts.get('pending', 0),
+            'resolved_petitions': counts.get('resolved', 0)
         }
         
         return jsonify({'department': dept_data}), 200
@@ -761,6 +919,7 @@ def update_department(dept_id):
             {'_id': ObjectId(dept_id)},
             {'$set': update_data}
         )
+        principals.invalidate_department(dept_id)
         
         if result.modified_count > 0:
             print(f"✅ Department updated: {data['name']}")
@@ -779,9 +938,11 @@ def delete_department(dept_id):
         if 'admin_id' not in session:
             return jsonify({'error': 'Unauthorized'}), 401
         
-        result = db.departments.delete_one({'_id': ObjectId(dept_id)})
+        department = db.departments.find_one_and_delete({'_id': ObjectId(dept_id)})
+        principals.invalidate_department(dept_id)
         
-        if result.deleted_count > 0:
+        if department:
+            delete_department_counters(db, department['name'])
             print(f"✅ Department deleted: {dept_id}")
             return jsonify({'message': 'Department deleted successfully'}), 200
         else:
@@ -801,15 +962,18 @@ def get_department_petitions(department_name):
             print(f"❌ No department session found")
             return jsonify({'error': 'Not authenticated'}), 401
         
-        petitions = Petition.find_by_department(department_name)
+        try:
+            limit, cursor = get_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Convert ObjectId to string for JSON serialization
-        for petition in petitions:
-            if '_id' in petition:
-                petition['_id'] = str(petition['_id'])
+        petitions = Petition.find_by_department(department_name, limit=limit, cursor=cursor)
         
         print(f"✅ Found {len(petitions)} petitions for {department_name}")
-        return jsonify({'petitions': petitions}), 200
+        return jsonify({
+            'petitions': petitions,
+            'next_cursor': next_cursor(petitions, limit)
+        }), 200
         
     except Exception as e:
         print(f"❌ Error fetching department petitions: {str(e)}")
@@ -823,16 +987,13 @@ def get_current_department():
         if 'department_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        department = db.departments.find_one({'_id': ObjectId(session['department_id'])})
+        department = principals.get_department(session['department_id'])
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
         # Get petition statistics
-        total_petitions = db.petitions.count_documents({'department': department['name']})
-        pending_petitions = db.petitions.count_documents({'department': department['name'], 'status': 'pending'})
-        in_progress_petitions = db.petitions.count_documents({'department': department['name'], 'status': 'in_progress'})
-        resolved_petitions = db.petitions.count_documents({'department': department['name'], 'status': 'resolved'})
+        counts = get_status_counts(db, department['name'])
         
         dept_data = {
             'id': str(department['_id']),
@@ -843,10 +1004,10 @@ def get_current_department():
             'phone': department.get('phone'),
             'address': department.get('address'),
             'statistics': {
-                'total': total_petitions,
-                'pending': pending_petitions,
-                'in_progress': in_progress_petitions,
-                'resolved': resolved_petitions
+                'total': counts['total'],
+                'pending': counts.get('pending', 0),
+                'in_progress': counts.get('in_progress', 0),
+                'resolved': counts.get('resolved', 0)
             }
         }
         
@@ -863,7 +1024,7 @@ def get_assigned_petitions():
         if 'department_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        department = db.departments.find_one({'_id': ObjectId(session['department_id'])})
+        department = principals.get_department(session['department_id'])
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
@@ -873,6 +1034,11 @@ def get_assigned_petitions():
         category_filter = request.args.get('category', '')
         search_query = request.args.get('search', '')
         
+        try:
+            projection = resolve_projection(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Build query
         query = {'department': department['name']}
         
@@ -882,14 +1048,29 @@ def get_assigned_petitions():
             query['urgency'] = urgency_filter
         if category_filter:
             query['category'] = category_filter
-        if search_query:
-            query['$or'] = [
-                {'title': {'$regex': search_query, '$options': 'i'}},
-                {'description': {'$regex': search_query, '$options': 'i'}},
-                {'ticket_id': {'$regex': search_query, '$options': 'i'}}
-            ]
         
-        petitions = list(db.petitions.find(query).sort('created_at', -1))
+        response = {}
+        if search_query.strip():
+            try:
+                limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), MAX_PAGE_SIZE)
+                page = int(request.args.get('page', 1))
+                if limit < 1 or page < 1:
+                    raise ValueError
+            except ValueError:
+                return jsonify({'error': 'limit and page must be positive integers'}), 400
+            
+            # Ranked text search (or ticket id prefix lookup), one page at a time
+            petitions, total = ranked_search(db, query, search_query, limit=limit, page=page, projection=projection)
+            response.update({
+                'total': total,
+                'page': page,
+                'limit': limit,
+                'has_more': page * limit < total,
+                # Status counts over every hit, for the page's header figures
+                'facets': search_facets(db, query, search_query)
+            })
+        else:
+            petitions = list(db.petitions.find(query, projection).sort('created_at', -1))
         
         # Convert ObjectId to string
         for petition in petitions:
@@ -899,7 +1080,8 @@ def get_assigned_petitions():
             if 'created_at' in petition:
                 petition['created_at'] = petition['created_at'].strftime('%Y-%m-%d %H:%M:%S')
         
-        return jsonify({'petitions': petitions}), 200
+        response['petitions'] = petitions
+        return jsonify(response), 200
         
     except Exception as e:
         print(f"❌ Error fetching assigned petitions: {str(e)}")
@@ -914,127 +1096,14 @@ def get_department_analytics():
         if 'department_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        department = db.departments.find_one({'_id': ObjectId(session['department_id'])})
+        department = principals.get_department(session['department_id'])
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
         # Get time range
         days = int(request.args.get('days', 30))
-        from datetime import datetime, timedelta
-        start_date = datetime.now() - timedelta(days=days)
-        
-        dept_name = department['name']
         
-        # Total petitions in time range
-        total_petitions = db.petitions.count_documents({
-            'department': dept_name,
-            'created_at': {'$gte': start_date}
-        })
-        
-        # Previous period for comparison
-        prev_start = start_date - timedelta(days=days)
-        prev_petitions = db.petitions.count_documents({
-            'department': dept_name,
-            'created_at': {'$gte': prev_start, '$lt': start_date}
-        })
-        
-        # Calculate trend
-        petition_trend = 0
-        if prev_petitions > 0:
-            petition_trend = round(((total_petitions - prev_petitions) / prev_petitions) * 100, 1)
-        
-        # Resolved petitions
-        resolved_petitions = db.petitions.count_documents({
-            'department': dept_name,
-            'status': 'resolved',
-            'created_at': {'$gte': start_date}
-        })
-        
-        # Resolution rate
-        resolution_rate = 0
-        if total_petitions > 0:
-            resolution_rate = round((resolved_petitions / total_petitions) * 100, 1)
-        
-        # Previous resolution rate
-        prev_resolved = db.petitions.count_documents({
-            'department': dept_name,
-            'status': 'resolved',
-            'created_at': {'$gte': prev_start, '$lt': start_date}
-        })
-        prev_resolution_rate = 0
-        if prev_petitions > 0:
-            prev_resolution_rate = round((prev_resolved / prev_petitions) * 100, 1)
-        
-        resolution_trend = round(resolution_rate - prev_resolution_rate, 1)
-        
-        # Status distribution
-        status_counts = {
-            'pending': db.petitions.count_documents({'department': dept_name, 'status': 'pending'}),
-            'in_progress': db.petitions.count_documents({'department': dept_name, 'status': 'in_progress'}),
-            'resolved': db.petitions.count_documents({'department': dept_name, 'status': 'resolved'}),
-            'rejected': db.petitions.count_documents({'department': dept_name, 'status': 'rejected'})
-        }
-        
-        # Category distribution
-        pipeline = [
-            {'$match': {'department': dept_name}},
-            {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
-            {'$sort': {'count': -1}},
-            {'$limit': 5}
-        ]
-        categories = list(db.petitions.aggregate(pipeline))
-        
-        # Trend data (last 6 months)
-        trend_data = []
-        for i in range(5, -1, -1):
-            month_start = datetime.now() - timedelta(days=i*30)
-            month_end = datetime.now() - timedelta(days=(i-1)*30) if i > 0 else datetime.now()
-            
-            submitted = db.petitions.count_documents({
-                'department': dept_name,
-                'created_at': {'$gte': month_start, '$lt': month_end}
-            })
-            
-            resolved = db.petitions.count_documents({
-                'department': dept_name,
-                'status': 'resolved',
-                'created_at': {'$gte': month_start, '$lt': month_end}
-            })
-            
-            trend_data.append({
-                'month': month_start.strftime('%b'),
-                'submitted': submitted,
-                'resolved': resolved
-            })
-        
-        # Urgency distribution
-        high_urgency = db.petitions.count_documents({'department': dept_name, 'urgency': 'high'})
-        
-        analytics = {
-            'metrics': {
-                'total_petitions': total_petitions,
-                'petition_trend': petition_trend,
-                'resolution_rate': resolution_rate,
-                'resolution_trend': resolution_trend,
-                'avg_response_time': 2.3,  # Can be calculated from actual data
-                'response_trend': -0.5,
-                'satisfaction_score': 4.2,  # Can be from user ratings
-                'satisfaction_trend': 0.3
-            },
-            'status_distribution': status_counts,
-            'category_distribution': [{'name': cat['_id'], 'count': cat['count']} for cat in categories],
-            'trend_data': trend_data,
-            'performance': {
-                'first_response': '1.8h',
-                'sla_compliance': 95,
-                'escalated_cases': high_urgency,
-                'reopened_petitions': db.petitions.count_documents({
-                    'department': dept_name,
-                    'status': 'in_progress',
-                    'updated_at': {'$exists': True}
-                })
-            }
-        }
+        analytics = build_department_analytics(db, department['name'], days)
         
         return jsonify(analytics), 200
         
@@ -1051,7 +1120,7 @@ def get_department_settings():
         if 'department_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        department = db.departments.find_one({'_id': ObjectId(session['department_id'])})
+        department = principals.get_department(session['department_id'])
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
@@ -1124,6 +1193,7 @@ def update_department_settings():
             {'_id': ObjectId(session['department_id'])},
             {'$set': update_data}
         )
+        principals.invalidate_department(session['department_id'])
         
         if result.modified_count > 0:
             return jsonify({'message': 'Settings updated successfully'}), 200
@@ -1157,8 +1227,10 @@ def update_petition_status(ticket_id):
         if rejection_reason:
             update_data['rejection_reason'] = rejection_reason
         
+        # Only apply the change if the status is still the one we read, so the
+        # department counters see every transition exactly once
         result = db.petitions.update_one(
-            {'ticket_id': ticket_id},
+            {'ticket_id': ticket_id, 'status': old_status},
             {
                 '$set': update_data,
                 '$currentDate': {'updated_at': True}
@@ -1166,17 +1238,34 @@ def update_petition_status(ticket_id):
         )
         
         if result.modified_count > 0:
-            # Send email notification if status changed
+            # Re-saving the same status (e.g. to edit the rejection reason) is
+            # not a transition: no counter move, stream event or email
             if old_status != new_status:
+                move_status(db, current_petition.get('department'), old_status, new_status)
+                if new_status in OPEN_STATUSES:
+                    deadline_scheduler.schedule(ticket_id, current_petition.get('deadline'))
+                else:
+                    deadline_scheduler.cancel(ticket_id)
+                publish_event(db, current_petition.get('department'), 'status_changed', {
+                    'ticket_id': ticket_id,
+                    'title': current_petition.get('title'),
+                    'old_status': old_status,
+                    'new_status': new_status
+                })
+                
+                # Send email notification for the change
                 try:
                     # Send rejection email if status is rejected
                     if new_status == 'rejected' and rejection_reason:
-                        from email_templates import get_rejection_email_template
-                        email_body = get_rejection_email_template(current_petition, rejection_reason)
-                        send_email(
+                        send_templated_email(
                             to_email=current_petition['email'],
                             subject=f"Petition Rejected - {current_petition['ticket_id']}",
-                            html_body=email_body
+                            template='rejection',
+                            context={
+                                'petition_data': pick_fields(current_petition, REJECTION_FIELDS),
+                                'rejection_reason': rejection_reason
+                            },
+                            lane='transactional'
                         )
                         print(f"📧 Rejection email queued for: {current_petition['email']} (ticket: {ticket_id})")
                     else:
@@ -1241,10 +1330,19 @@ def get_all_petitions():
             print("❌ Admin not authenticated")
             return jsonify({'error': 'Not authenticated'}), 401
         
-        petitions = Petition.find_all()
+        try:
+            limit, cursor = get_page_args()
+            projection = resolve_projection(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        petitions = Petition.find_all(limit=limit, cursor=cursor, projection=projection)
         print(f"✅ Found {len(petitions)} petitions")
         
-        return jsonify({'petitions': petitions}), 200
+        return jsonify({
+            'petitions': petitions,
+            'next_cursor': next_cursor(petitions, limit)
+        }), 200
         
     except Exception as e:
         print(f"❌ Error fetching all petitions: {str(e)}")
@@ -1257,89 +1355,7 @@ def get_admin_stats():
     try:
         print("Fetching admin stats...")
         
-        # Fetch all data
-        petitions = Petition.find_all()
-        departments = Department.find_all()
-        users = list(db.users.find())
-        
-        print(f"Found {len(petitions)} petitions, {len(departments)} departments, {len(users)} users")
-        
-        # Basic stats
-        total = len(petitions)
-        pending = len([p for p in petitions if p.get('status') == 'pending'])
-        in_progress = len([p for p in petitions if p.get('status') == 'in_progress'])
-        resolved = len([p for p in petitions if p.get('status') == 'resolved'])
-        
-        print(f"Stats: total={total}, pending={pending}, in_progress={in_progress}, resolved={resolved}")
-        
-        # Department-wise stats
-        dept_stats = {}
-        for dept in departments:
-            dept_name = dept['name']
-            dept_petitions = [p for p in petitions if p.get('department') == dept_name]
-            dept_stats[dept_name] = {
-                'total': len(dept_petitions),
-                'pending': len([p for p in dept_petitions if p.get('status') == 'pending']),
-                'resolved': len([p for p in dept_petitions if p.get('status') == 'resolved'])
-            }
-        
-        # Helper function to get timezone-aware datetime
-        def get_aware_datetime(dt):
-            if dt is None:
-                return datetime.min.replace(tzinfo=UTC)
-            if isinstance(dt, str):
-                # Try to parse ISO format string
-                try:
-                    parsed = datetime.fromisoformat(dt.replace('Z', '+00:00'))
-                    if parsed.tzinfo is None:
-                        return parsed.replace(tzinfo=UTC)
-                    return parsed
-                except:
-                    return datetime.min.replace(tzinfo=UTC)
-            if dt.tzinfo is None:
-                return dt.replace(tzinfo=UTC)
-            return dt
-        
-        # Recent petitions (last 30 days)
-        from datetime import timedelta
-        thirty_days_ago = datetime.now(UTC) - timedelta(days=30)
-        recent_petitions = []
-        for p in petitions:
-            created_at = get_aware_datetime(p.get('created_at'))
-            if created_at >= thirty_days_ago:
-                recent_petitions.append(p)
-        
-        # Daily stats for last 7 days
-        daily_stats = []
-        for i in range(6, -1, -1):
-            day = datetime.now(UTC) - timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            day_petitions = []
-            for p in petitions:
-                created_at = get_aware_datetime(p.get('created_at'))
-                if day_start <= created_at < day_end:
-                    day_petitions.append(p)
-            
-            daily_stats.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'total': len(day_petitions),
-                'pending': len([p for p in day_petitions if p.get('status') == 'pending']),
-                'resolved': len([p for p in day_petitions if p.get('status') == 'resolved'])
-            })
-        
-        stats_response = {
-            'total_petitions': total,
-            'pending': pending,
-            'in_progress': in_progress,
-            'resolved': resolved,
-            'total_users': len(users),
-            'total_departments': len(departments),
-            'department_stats': dept_stats,
-            'daily_stats': daily_stats,
-            'recent_petitions_count': len(recent_petitions)
-        }
+        stats_response = admin_stats(db)
         
         print(f"Returning stats: {stats_response}")
         return jsonify(stats_response), 200
@@ -1358,6 +1374,75 @@ def get_admin_stats():
             'total_departments': 0
         }), 500
 
+@app.route('/api/admin/db-pool-stats')
+def get_db_pool_stats():
+    """Connection pool configuration and checkout wait times for this worker"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        return jsonify(get_pool_stats()), 200
+
+    except Exception as e:
+        print(f"❌ Error fetching pool stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/email-queue-stats')
+def get_email_queue_stats():
+    """Outbox counts by status, plus in-flight sends and delivery counters for this worker"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        return jsonify(email_dispatcher.snapshot()), 200
+
+    except Exception as e:
+        print(f"❌ Error fetching email queue stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/email-outbox/retry-dead', methods=['POST'])
+def retry_dead_emails():
+    """Requeue every dead-lettered email"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        requeued = retry_dead_letters(db)
+        return jsonify({'message': f'Requeued {requeued} emails', 'requeued': requeued}), 200
+
+    except Exception as e:
+        print(f"❌ Error requeuing dead-lettered emails: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/rebuild-counters', methods=['POST'])
+def rebuild_petition_counters():
+    """Reconcile the per-department petition counters with the petitions collection"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        written = rebuild_counters(db)
+        mark_counters_migrated(db)
+        rebuild_unread_counters(db)
+        return jsonify({'message': f'Rebuilt {written} petition counters', 'counters': written}), 200
+
+    except Exception as e:
+        print(f"❌ Error rebuilding counters: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/index-report')
+def get_index_report():
+    """Declared indexes that are missing and existing indexes that are unused"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        return jsonify(index_report(db)), 200
+
+    except Exception as e:
+        print(f"❌ Error building index report: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # Dashboard Routes
 @app.route('/api/dashboard/stats/<user_id>')
 def get_dashboard_stats(user_id):
@@ -1439,6 +1524,8 @@ def extend_petition_deadline(ticket_id):
             {'ticket_id': ticket_id},
             {'$set': {'deadline': new_deadline, 'updated_at': datetime.now(UTC)}}
         )
+        if petition.get('status') in OPEN_STATUSES:
+            deadline_scheduler.schedule(ticket_id, new_deadline)
         
         return jsonify({
             'message': 'Deadline extended successfully',
@@ -1450,29 +1537,31 @@ def extend_petition_deadline(ticket_id):
 
 @app.route('/api/admin/overdue-petitions')
 def get_overdue_petitions():
-    """Get all overdue petitions"""
+    """Get overdue petitions, optionally for one department, paginated or as a count"""
     try:
-        petitions = Petition.find_all()
         now = datetime.now(UTC)
-        overdue = []
+        department = request.args.get('department') or None
         
-        for petition in petitions:
-            if petition.get('status') in ['pending', 'in_progress']:
-                deadline = petition.get('deadline')
-                if deadline:
-                    if isinstance(deadline, str):
-                        deadline = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
-                    elif deadline.tzinfo is None:
-                        deadline = deadline.replace(tzinfo=UTC)
-                    
-                    if deadline < now:
-                        time_overdue = now - deadline
-                        petition['hours_overdue'] = time_overdue.total_seconds() / 3600
-                        overdue.append(petition)
+        if request.args.get('count_only', '').lower() in ('1', 'true', 'yes'):
+            return jsonify({'count': Petition.count_overdue(now, department)}), 200
+        
+        try:
+            limit, cursor = get_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        overdue = Petition.find_overdue(now, department, limit=limit, cursor=cursor)
+        
+        for petition in overdue:
+            deadline = petition['deadline']
+            if deadline.tzinfo is None:
+                deadline = deadline.replace(tzinfo=UTC)
+            petition['hours_overdue'] = (now - deadline).total_seconds() / 3600
         
         return jsonify({
             'overdue_petitions': overdue,
-            'count': len(overdue)
+            'count': len(overdue),
+            'next_cursor': next_cursor(overdue, limit, 'deadline')
         }), 200
         
     except Exception as e:
@@ -1480,44 +1569,49 @@ def get_overdue_petitions():
 
 @app.route('/api/admin/send-deadline-reminders', methods=['POST'])
 def send_deadline_reminders():
-    """Send deadline reminder emails to departments for petitions approaching deadline"""
+    """Send each department one digest of its petitions approaching their deadline"""
     try:
-        petitions = Petition.find_all()
         now = datetime.now(UTC)
-        reminders_sent = 0
         
+        # Petitions with less than 48 hours remaining that weren't reminded about
+        # within the interval, soonest deadline first, from the status+deadline index
+        projection = {field: 1 for field in REMINDER_FIELDS + ('deadline',)}
+        petitions = Petition.claim_due_reminders(now, 48, now - DEADLINE_REMINDER_INTERVAL, projection)
+        
+        by_department = {}
         for petition in petitions:
-            if petition.get('status') in ['pending', 'in_progress']:
-                deadline = petition.get('deadline')
-                if deadline:
-                    if isinstance(deadline, str):
-                        deadline = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
-                    elif deadline.tzinfo is None:
-                        deadline = deadline.replace(tzinfo=UTC)
-                    
-                    time_remaining = deadline - now
-                    hours_remaining = time_remaining.total_seconds() / 3600
-                    
-                    # Send reminders for petitions with less than 48 hours remaining
-                    if 0 < hours_remaining < 48:
-                        # Get department email
-                        dept_name = petition.get('department')
-                        department = Department.find_by_email(dept_name.lower().replace(' ', '_') + '@dept.com')
-                        
-                        if department and department.get('email'):
-                            email_html = get_deadline_reminder_template(petition, hours_remaining)
-                            subject = f"⚠️ Deadline Reminder: Petition {petition.get('ticket_id')}"
-                            
-                            try:
-                                send_email(department['email'], subject, email_html)
-                                reminders_sent += 1
-                                print(f"Sent deadline reminder to {department['email']} for {petition.get('ticket_id')}")
-                            except Exception as email_error:
-                                print(f"Failed to send reminder email: {str(email_error)}")
+            by_department.setdefault(petition.get('department'), []).append({
+                'petition_data': pick_fields(petition, REMINDER_FIELDS),
+                'deadline': petition['deadline']
+            })
+        
+        departments = {
+            dept['name']: dept
+            for dept in db.departments.find({'name': {'$in': list(by_department)}}, {'name': 1, 'email': 1})
+        }
+        
+        messages = []
+        reminders_sent = 0
+        for dept_name, items in by_department.items():
+            department = departments.get(dept_name)
+            if not department or not department.get('email'):
+                print(f"⚠️ No department email for {dept_name}; {len(items)} reminder(s) skipped")
+                continue
+            messages.append({
+                'to_email': department['email'],
+                'subject': f"⚠️ Deadline Reminder - {dept_name}",
+                'template': 'deadline_digest',
+                'context': {'department_name': dept_name, 'items': items}
+            })
+            reminders_sent += len(items)
+        
+        send_templated_emails(messages, lane='alert')
+        print(f"⏰ Queued {reminders_sent} deadline reminder(s) in {len(messages)} digest(s)")
         
         return jsonify({
-            'message': f'Sent {reminders_sent} deadline reminder(s)',
-            'reminders_sent': reminders_sent
+            'message': f'Sent {reminders_sent} deadline reminder(s) to {len(messages)} department(s)',
+            'reminders_sent': reminders_sent,
+            'emails_sent': len(messages)
         }), 200
         
     except Exception as e:
@@ -1528,7 +1622,7 @@ def send_deadline_reminders():
 @app.route('/api/profile/<user_id>')
 def get_user_profile(user_id):
     try:
-        user = User.find_by_id(ObjectId(user_id))
+        user = principals.get_user(user_id)
         if user:
             return jsonify({
                 'name': user['name'],
@@ -1555,6 +1649,7 @@ def update_user_profile(user_id):
                 'updated_at': datetime.now(UTC)
             }}
         )
+        principals.invalidate_user(user_id)
         
         if result.modified_count > 0:
             return jsonify({'message': 'Profile updated successfully'}), 200
@@ -1579,29 +1674,48 @@ def search_petitions():
         
         if data.get('ticket_id'):
             query['ticket_id'] = data['ticket_id']
-        if data.get('status'):
-            query['status'] = data['status']
-        if data.get('category'):
-            query['category'] = data['category']
-        if data.get('date_from'):
-            query['created_at'] = {'$gte': datetime.fromisoformat(data['date_from'])}
-        if data.get('date_to'):
-            if 'created_at' in query:
-                query['created_at']['$lte'] = datetime.fromisoformat(data['date_to'])
-            else:
-                query['created_at'] = {'$lte': datetime.fromisoformat(data['date_to'])}
+        for field in ('status', 'category', 'urgency', 'department'):
+            if data.get(field):
+                query[field] = data[field]
+        
+        try:
+            if data.get('date_from'):
+                query['created_at'] = {'$gte': parse_date_bound(data['date_from'])}
+            if data.get('date_to'):
+                query.setdefault('created_at', {})['$lte'] = parse_date_bound(data['date_to'], end=True)
+            
+            sort = data.get('sort') or 'newest'
+            if sort not in SEARCH_SORTS:
+                raise ValueError(f"sort must be one of: {', '.join(SEARCH_SORTS)}")
+            
+            limit = min(int(data.get('limit') or SEARCH_PAGE_SIZE), MAX_PAGE_SIZE)
+            page = int(data.get('page') or 1)
+            if limit < 1 or page < 1:
+                raise ValueError('limit and page must be positive integers')
+            
+            projection = resolve_projection(data.get('fields') or request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         print(f'Final MongoDB query: {query}')
         
-        cursor = db.petitions.find(query).sort('created_at', -1)
-        petitions = list(cursor)
+        petitions, total, facets = faceted_search(
+            db, query, sort=sort, limit=limit, page=page, projection=projection
+        )
         
         # Convert ObjectId to string for JSON serialization
         for petition in petitions:
             petition['_id'] = str(petition['_id'])
         
-        print(f'Found {len(petitions)} petitions')
-        return jsonify({'petitions': petitions}), 200
+        print(f'Found {total} petitions, returning {len(petitions)}')
+        return jsonify({
+            'petitions': petitions,
+            'total': total,
+            'page': page,
+            'limit': limit,
+            'has_more': page * limit < total,
+            'facets': facets
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1622,7 +1736,7 @@ def check_auth():
 def get_current_user():
     if 'user_id' in session:
         user_id = session['user_id']
-        user = User.find_by_id(ObjectId(user_id))
+        user = principals.get_user(user_id)
         if user:
             return jsonify({
                 'id': str(user['_id']),
@@ -1631,7 +1745,7 @@ def get_current_user():
             }), 200
     elif 'department_id' in session:
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         if department:
             return jsonify({
                 'id': str(department['_id']),
@@ -1641,7 +1755,7 @@ def get_current_user():
             }), 200
     elif 'admin_id' in session:
         admin_id = session['admin_id']
-        admin = db.admins.find_one({'_id': ObjectId(admin_id)})
+        admin = principals.get_admin(admin_id)
         if admin:
             return jsonify({
                 'id': str(admin['_id']),
@@ -1664,41 +1778,92 @@ def get_current_user_id():
 
 @app.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    """Get notifications for the logged-in department"""
+    """Get notifications for the logged-in department, newest first, one page at a time"""
     try:
         if 'department_id' not in session:
             return jsonify({'error': 'Not authorized'}), 401
         
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
         dept_name = department['name']
         
-        # Filter notifications for this department
-        dept_notifications = [
-            notif for notif in notifications_store 
-            if notif['department'] == dept_name
-        ]
+        try:
+            limit, cursor = get_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        unread_only = request.args.get('unread') in ('1', 'true')
         
-        # Sort by timestamp (newest first)
-        dept_notifications.sort(key=lambda x: x['timestamp'], reverse=True)
+        dept_notifications, next_page = list_notifications(
+            db, dept_name, limit=limit or NOTIFICATION_PAGE_SIZE, cursor=cursor, unread_only=unread_only
+        )
         
         print(f"📬 Fetched {len(dept_notifications)} notifications for {dept_name}")
         
         return jsonify({
             'success': True,
-            'notifications': dept_notifications,
+            'notifications': [serialize_notification(n) for n in dept_notifications],
             'count': len(dept_notifications),
-            'unread_count': sum(1 for n in dept_notifications if not n['read'])
+            'unread_count': count_unread(db, dept_name),
+            'next_cursor': next_page
         }), 200
         
     except Exception as e:
         print(f"❌ Error fetching notifications: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Seconds between keep-alive comments on an idle notification stream
+STREAM_HEARTBEAT = 15
+
+@app.route('/api/notifications/stream')
+def notification_stream():
+    """Server-Sent Events: new-petition and status-change events for the logged-in department.
+
+    Reconnecting clients send Last-Event-ID and get the events they missed
+    (kept for a day) before live ones.
+    """
+    if 'department_id' not in session:
+        return jsonify({'error': 'Not authorized'}), 401
+    
+    department = principals.get_department(session['department_id'])
+    if not department:
+        return jsonify({'error': 'Department not found'}), 404
+    
+    dept_name = department['name']
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    # Subscribe before replaying so nothing published in between is lost
+    subscription = notification_broker.subscribe(dept_name)
+    
+    def generate():
+        replayed = set()
+        try:
+            yield "retry: 5000\n\n"
+            if last_event_id:
+                for event in notification_broker.replay(dept_name, last_event_id):
+                    replayed.add(event['_id'])
+                    yield format_event(event)
+            while not subscription.closed:
+                event = subscription.get(timeout=STREAM_HEARTBEAT)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                # The broker may also deliver events that were just replayed
+                if event['_id'] in replayed:
+                    continue
+                yield format_event(event)
+        finally:
+            notification_broker.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/notifications/<notification_id>/read', methods=['PUT'])
 def mark_notification_read(notification_id):
     """Mark a notification as read"""
@@ -1706,21 +1871,15 @@ def mark_notification_read(notification_id):
         if 'department_id' not in session:
             return jsonify({'error': 'Not authorized'}), 401
         
-        # Find notification by ID
-        notification = next((n for n in notifications_store if n['id'] == notification_id), None)
-        
-        if not notification:
-            return jsonify({'error': 'Notification not found'}), 404
-        
-        # Verify department ownership
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
-        if notification['department'] != department['name']:
-            return jsonify({'error': 'Not authorized'}), 403
+        if not department:
+            return jsonify({'error': 'Department not found'}), 404
         
-        # Mark as read
-        notification['read'] = True
+        # Only matches the department's own notifications
+        if mark_read(db, department['name'], notification_id) is None:
+            return jsonify({'error': 'Notification not found'}), 404
         
         print(f"✅ Notification {notification_id} marked as read")
         
@@ -1741,22 +1900,14 @@ def get_unread_notification_count():
             return jsonify({'error': 'Not authorized'}), 401
         
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
-        dept_name = department['name']
-        
-        # Count unread notifications for this department
-        unread_count = sum(
-            1 for notif in notifications_store 
-            if notif['department'] == dept_name and not notif['read']
-        )
-        
         return jsonify({
             'success': True,
-            'unread_count': unread_count
+            'unread_count': count_unread(db, department['name'])
         }), 200
         
     except Exception as e:
@@ -1771,19 +1922,15 @@ def mark_all_notifications_read():
             return jsonify({'error': 'Not authorized'}), 401
         
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
         
         dept_name = department['name']
         
-        # Mark all notifications for this department as read
-        marked_count = 0
-        for notif in notifications_store:
-            if notif['department'] == dept_name and not notif['read']:
-                notif['read'] = True
-                marked_count += 1
+        # One update_many over the department's unread range of the index
+        marked_count = mark_all_read(db, dept_name)
         
         print(f"✅ Marked {marked_count} notifications as read for {dept_name}")
         
@@ -1798,87 +1945,44 @@ def mark_all_notifications_read():
 
 # ============= REPORT GENERATION Functions =============
 
+def queue_daily_reports(departments):
+    """Build the daily summary for each department and queue them all.
+
+    One aggregation covers every department and the emails go into the
+    outbox in one write; the email workers render them. Returns the number
+    of reports queued.
+    """
+    now = datetime.now(UTC)
+    reports = daily_reports(db, [dept['name'] for dept in departments], now=now)
+    return send_templated_emails([
+        {
+            'to_email': dept['email'],
+            'subject': f"📊 Daily Summary Report - {dept['name']} - {now.strftime('%B %d, %Y')}",
+            'template': 'daily_summary',
+            'context': {'summary_data': reports[dept['name']]}
+        }
+        for dept in departments
+    ], lane='bulk')
+
+def queue_weekly_reports(departments):
+    """Build the weekly performance report for each department and queue them all"""
+    now = datetime.now(UTC)
+    week_ago = now - timedelta(days=7)
+    reports = weekly_reports(db, [dept['name'] for dept in departments], now=now)
+    return send_templated_emails([
+        {
+            'to_email': dept['email'],
+            'subject': f"📈 Weekly Performance Report - {dept['name']} - Week of {week_ago.strftime('%B %d')}",
+            'template': 'weekly_report',
+            'context': {'report_data': reports[dept['name']]}
+        }
+        for dept in departments
+    ], lane='bulk')
+
 def send_daily_report(department_name, dept_email):
     """Generate and send daily summary report for a department"""
     try:
-        # Get date range (last 24 hours)
-        now = datetime.now(UTC)
-        yesterday = now - timedelta(days=1)
-        
-        # Query petitions for this department in last 24 hours
-        petitions_today = list(db.petitions.find({
-            'department': department_name,
-            'created_at': {'$gte': yesterday}
-        }))
-        
-        # Calculate statistics
-        new_petitions = len(petitions_today)
-        
-        resolved_today = db.petitions.count_documents({
-            'department': department_name,
-            'status': 'resolved',
-            'updated_at': {'$gte': yesterday}
-        })
-        
-        pending = db.petitions.count_documents({
-            'department': department_name,
-            'status': 'pending'
-        })
-        
-        high_urgency = db.petitions.count_documents({
-            'department': department_name,
-            'urgency': 'high',
-            'status': {'$ne': 'resolved'}
-        })
-        
-        # Get high urgency petitions list (top 5)
-        high_urgency_petitions = list(db.petitions.find({
-            'department': department_name,
-            'urgency': 'high',
-            'status': {'$ne': 'resolved'}
-        }).sort('created_at', -1).limit(5))
-        
-        # Get new petitions today (top 5)
-        new_today = petitions_today[:5] if len(petitions_today) > 5 else petitions_today
-        
-        # Prepare data for template
-        summary_data = {
-            'department_name': department_name,
-            'date': now.strftime('%B %d, %Y'),
-            'new_petitions': new_petitions,
-            'resolved_today': resolved_today,
-            'pending': pending,
-            'high_urgency': high_urgency,
-            'high_urgency_petitions': [
-                {
-                    'ticket_id': p['ticket_id'],
-                    'title': p['title'],
-                    'urgency': p['urgency'],
-                    'category': p['category']
-                }
-                for p in high_urgency_petitions
-            ],
-            'new_today': [
-                {
-                    'ticket_id': p['ticket_id'],
-                    'title': p['title'],
-                    'urgency': p['urgency'],
-                    'category': p['category']
-                }
-                for p in new_today
-            ]
-        }
-        
-        # Generate HTML template
-        html_content = get_daily_summary_template(summary_data)
-        
-        # Send email
-        send_email(
-            to_email=dept_email,
-            subject=f"📊 Daily Summary Report - {department_name} - {now.strftime('%B %d, %Y')}",
-            html_body=html_content
-        )
-        
+        queue_daily_reports([{'name': department_name, 'email': dept_email}])
         print(f"📧 Daily report sent to {department_name} ({dept_email})")
         return True
         
@@ -1889,94 +1993,7 @@ def send_daily_report(department_name, dept_email):
 def send_weekly_report(department_name, dept_email):
     """Generate and send weekly performance report for a department"""
     try:
-        # Get date ranges
-        now = datetime.now(UTC)
-        week_ago = now - timedelta(days=7)
-        two_weeks_ago = now - timedelta(days=14)
-        
-        # Query petitions for this week
-        petitions_this_week = list(db.petitions.find({
-            'department': department_name,
-            'created_at': {'$gte': week_ago}
-        }))
-        
-        # Query petitions for previous week (for trends)
-        petitions_last_week = list(db.petitions.find({
-            'department': department_name,
-            'created_at': {'$gte': two_weeks_ago, '$lt': week_ago}
-        }))
-        
-        # Calculate statistics
-        total_petitions = len(petitions_this_week)
-        prev_total = len(petitions_last_week)
-        
-        resolved_count = sum(1 for p in petitions_this_week if p['status'] == 'resolved')
-        resolution_rate = (resolved_count / total_petitions * 100) if total_petitions > 0 else 0
-        
-        prev_resolved = sum(1 for p in petitions_last_week if p['status'] == 'resolved')
-        prev_resolution_rate = (prev_resolved / prev_total * 100) if prev_total > 0 else 0
-        
-        # Status breakdown
-        status_breakdown = {
-            'resolved': sum(1 for p in petitions_this_week if p['status'] == 'resolved'),
-            'in_progress': sum(1 for p in petitions_this_week if p['status'] == 'in-progress'),
-            'pending': sum(1 for p in petitions_this_week if p['status'] == 'pending')
-        }
-        
-        # Calculate average response time (mock - could be calculated from actual timestamps)
-        avg_response_time = "2.5 hours"
-        response_trend = 15  # Mock improvement percentage
-        
-        # Satisfaction score (mock - could come from user feedback)
-        satisfaction_score = 4.5
-        satisfaction_trend = 5
-        
-        # Generate insights
-        insights = []
-        
-        if total_petitions > prev_total:
-            increase_pct = ((total_petitions - prev_total) / prev_total * 100) if prev_total > 0 else 100
-            insights.append(f"Petition volume increased by {increase_pct:.1f}% compared to last week")
-        elif total_petitions < prev_total:
-            decrease_pct = ((prev_total - total_petitions) / prev_total * 100) if prev_total > 0 else 0
-            insights.append(f"Petition volume decreased by {decrease_pct:.1f}% compared to last week")
-        
-        if resolution_rate > prev_resolution_rate:
-            insights.append(f"Resolution rate improved by {(resolution_rate - prev_resolution_rate):.1f}%")
-        
-        if status_breakdown['pending'] > total_petitions * 0.3:
-            insights.append(f"High number of pending petitions ({status_breakdown['pending']}) - consider prioritizing")
-        
-        if not insights:
-            insights.append("Performance is stable compared to last week")
-        
-        # Prepare data for template
-        report_data = {
-            'department_name': department_name,
-            'week_start': week_ago.strftime('%B %d'),
-            'week_end': now.strftime('%B %d, %Y'),
-            'total_petitions': total_petitions,
-            'petitions_trend': ((total_petitions - prev_total) / prev_total * 100) if prev_total > 0 else 0,
-            'resolution_rate': f"{resolution_rate:.1f}%",
-            'resolution_trend': resolution_rate - prev_resolution_rate,
-            'avg_response_time': avg_response_time,
-            'response_trend': response_trend,
-            'satisfaction_score': satisfaction_score,
-            'satisfaction_trend': satisfaction_trend,
-            'status_breakdown': status_breakdown,
-            'insights': insights
-        }
-        
-        # Generate HTML template
-        html_content = get_weekly_report_template(report_data)
-        
-        # Send email
-        send_email(
-            to_email=dept_email,
-            subject=f"📈 Weekly Performance Report - {department_name} - Week of {week_ago.strftime('%B %d')}",
-            html_body=html_content
-        )
-        
+        queue_weekly_reports([{'name': department_name, 'email': dept_email}])
         print(f"📧 Weekly report sent to {department_name} ({dept_email})")
         return True
         
@@ -1984,6 +2001,14 @@ def send_weekly_report(department_name, dept_email):
         print(f"❌ Error sending weekly report to {department_name}: {str(e)}")
         return False
 
+def report_recipients(preference):
+    """Departments that have the given report enabled in their notification preferences"""
+    departments = db.departments.find({}, {'name': 1, 'email': 1, 'notification_preferences': 1})
+    return [
+        dept for dept in departments
+        if dept.get('notification_preferences', {}).get(preference, True)
+    ]
+
 # ============= REPORT TRIGGER APIs =============
 
 @app.route('/api/reports/daily', methods=['POST'])
@@ -1994,7 +2019,7 @@ def trigger_daily_report():
             return jsonify({'error': 'Not authorized'}), 401
         
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
@@ -2030,7 +2055,7 @@ def trigger_weekly_report():
             return jsonify({'error': 'Not authorized'}), 401
         
         dept_id = session['department_id']
-        department = db.departments.find_one({'_id': ObjectId(dept_id)})
+        department = principals.get_department(dept_id)
         
         if not department:
             return jsonify({'error': 'Department not found'}), 404
@@ -2063,14 +2088,7 @@ def send_all_daily_reports():
     """Send daily reports to all departments (for scheduled task)"""
     try:
         # This endpoint could be protected with an API key for cron jobs
-        departments = db.departments.find()
-        
-        sent_count = 0
-        for dept in departments:
-            preferences = dept.get('notification_preferences', {})
-            if preferences.get('daily_summary', True):
-                if send_daily_report(dept['name'], dept['email']):
-                    sent_count += 1
+        sent_count = queue_daily_reports(report_recipients('daily_summary'))
         
         print(f"📧 Sent daily reports to {sent_count} departments")
         
@@ -2088,14 +2106,7 @@ def send_all_weekly_reports():
     """Send weekly reports to all departments (for scheduled task)"""
     try:
         # This endpoint could be protected with an API key for cron jobs
-        departments = db.departments.find()
-        
-        sent_count = 0
-        for dept in departments:
-            preferences = dept.get('notification_preferences', {})
-            if preferences.get('weekly_report', True):
-                if send_weekly_report(dept['name'], dept['email']):
-                    sent_count += 1
+        sent_count = queue_weekly_reports(report_recipients('weekly_report'))
         
         print(f"📧 Sent weekly reports to {sent_count} departments")
         
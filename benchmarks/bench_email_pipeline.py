@@ -0,0 +1,401 @@
+"""
+Throughput and enqueue-to-delivery latency of the email pipeline against a
+local SMTP sink.
+
+Messages go through the real outbox, dispatcher, template rendering and
+SMTP pool; only the SMTP server is replaced by an in-process sink with
+configurable latency and failure injection. Needs the MongoDB from
+config.py; the run uses (and drops) a scratch database, never the app's.
+
+    python benchmarks/bench_email_pipeline.py [--duration 20] [--workers 3] [--pool-size 3]
+        [--smtp-latency-ms 20] [--fail-rate 0.05] [--reject-rate 0.01]
+"""
+import argparse
+import contextlib
+import os
+import random
+import resource
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config  # noqa: E402
+
+SINK_HOST = '127.0.0.1'
+
+SCENARIOS = ('send_email', 'send_otp_email', 'report')
+
+# Stands in for a department's daily summary; shaped like reports.daily_reports output
+SUMMARY_DATA = {
+    'department_name': 'Public Works', 'date': 'October 17, 2026', 'new_petitions': 14,
+    'resolved_today': 6, 'pending': 31, 'high_urgency': 4,
+    'high_urgency_petitions': [
+        {'ticket_id': f'PET-20261017-{i:04d}', 'title': f'Petition {i}', 'urgency': 'high', 'category': 'Roads'}
+        for i in range(5)
+    ],
+    'new_today': [
+        {'ticket_id': f'PET-20261017-{i:04d}', 'title': f'Petition {i}', 'urgency': 'low', 'category': 'Water'}
+        for i in range(5, 10)
+    ]
+}
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that accepts, delays or refuses each message.
+
+    After the DATA terminator it waits `latency` seconds, then replies 550
+    with probability `reject_rate`, 451 with probability `fail_rate`, and
+    250 otherwise. `on_message(recipients, outcome)` is called for each.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, on_message, latency=0.0, fail_rate=0.0, reject_rate=0.0, seed=None):
+        super().__init__((SINK_HOST, 0), SMTPSinkHandler)
+        self.on_message = on_message
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'connections': 0, 'accepted': 0, 'deferred': 0, 'rejected': 0}
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def outcome(self):
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.reject_rate:
+            return 'rejected'
+        if roll < self.reject_rate + self.fail_rate:
+            return 'deferred'
+        return 'accepted'
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    REPLIES = {
+        'accepted': b'250 2.0.0 Queued\r\n',
+        'deferred': b'451 4.3.0 Try again later\r\n',
+        'rejected': b'550 5.1.1 Mailbox unavailable\r\n'
+    }
+
+    def handle(self):
+        self.server.count('connections')
+        self.wfile.write(b'220 bench-sink ESMTP\r\n')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb in (b'EHLO', b'HELO'):
+                self.wfile.write(b'250-bench-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n')
+            elif verb == b'MAIL':
+                recipients = []
+                self.wfile.write(b'250 2.1.0 OK\r\n')
+            elif verb == b'RCPT':
+                recipients.append(line.split(b'<', 1)[-1].split(b'>', 1)[0].decode())
+                self.wfile.write(b'250 2.1.5 OK\r\n')
+            elif verb == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                outcome = self.server.outcome()
+                self.server.count(outcome)
+                self.server.on_message(recipients, outcome)
+                self.wfile.write(self.REPLIES[outcome])
+            elif verb in (b'RSET', b'NOOP'):
+                recipients = [] if verb == b'RSET' else recipients
+                self.wfile.write(b'250 2.0.0 OK\r\n')
+            elif verb == b'QUIT':
+                self.wfile.write(b'221 2.0.0 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'502 5.5.2 Command not recognized\r\n')
+
+
+class Tracker:
+    """Enqueue time and final outcome of every message the benchmark sends"""
+
+    def __init__(self, domains, max_attempts):
+        self.domains = domains
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._messages = {}  # address -> message record
+        self.enqueue_seconds = {scenario: [] for scenario in SCENARIOS}
+        self.errors = 0
+
+    def address(self, scenario):
+        """A fresh recipient for one message, spread over the test domains"""
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        address = f"bench+{sequence}@d{sequence % self.domains}.bench.test"
+        with self._lock:
+            self._messages[address] = {'scenario': scenario, 'enqueued_at': None, 'failures': 0, 'outcome': None}
+        return address
+
+    def enqueued(self, scenario, addresses, started, finished):
+        with self._lock:
+            for address in addresses:
+                self._messages[address]['enqueued_at'] = started
+            self.enqueue_seconds[scenario].append(finished - started)
+
+    def failed_to_enqueue(self, addresses):
+        with self._lock:
+            self.errors += 1
+            for address in addresses:
+                self._messages.pop(address, None)
+
+    def on_message(self, recipients, outcome):
+        now = time.monotonic()
+        with self._lock:
+            for address in recipients:
+                message = self._messages.get(address)
+                if message is None or message['outcome']:
+                    continue
+                if outcome == 'deferred':
+                    message['failures'] += 1
+                    if message['failures'] >= self.max_attempts:
+                        message['outcome'] = 'dead'
+                    continue
+                message['outcome'] = 'delivered' if outcome == 'accepted' else 'dead'
+                message['finished_at'] = now
+
+    def outstanding(self):
+        with self._lock:
+            return sum(1 for message in self._messages.values() if message['outcome'] is None)
+
+    def results(self):
+        with self._lock:
+            return list(self._messages.values())
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+def rss_mb():
+    """Current resident set size, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def configure(args, sink_port):
+    """Point the email modules at the sink and the scratch database before they are imported"""
+    overrides = {
+        'MONGO_DB_NAME': args.database,
+        'SMTP_SERVER': SINK_HOST,
+        'SMTP_PORT': sink_port,
+        'SMTP_USERNAME': '',
+        'SMTP_PASSWORD': '',
+        'SMTP_USE_TLS': False,
+        'SMTP_POOL_SIZE': args.pool_size,
+        'EMAIL_WORKERS': args.workers,
+        'EMAIL_MAX_PER_DOMAIN': args.per_domain,
+        'EMAIL_WORKERS_ENABLED': True,
+        'EMAIL_OUTBOX_POLL_INTERVAL': args.poll_interval,
+        'EMAIL_RETRY_BASE_SECONDS': args.retry_base,
+        'EMAIL_RETRY_CAP_SECONDS': args.retry_base * 8
+    }
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+
+
+def drive(name, rate, duration, call, stop):
+    """Call `call()` `rate` times a second for `duration` seconds, on schedule"""
+    if rate <= 0:
+        return
+    interval = 1 / rate
+    next_at = time.monotonic()
+    deadline = next_at + duration
+    while next_at < deadline and not stop.is_set():
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            call()
+        except Exception as e:
+            print(f"❌ {name} failed: {str(e)}", file=sys.stderr)
+        next_at += interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load (default 20)')
+    parser.add_argument('--email-rate', type=float, default=20, help='send_email calls per second (default 20)')
+    parser.add_argument('--otp-rate', type=float, default=5, help='send_otp_email calls per second (default 5)')
+    parser.add_argument('--report-interval', type=float, default=10,
+                        help='seconds between batches of daily reports, 0 for none (default 10)')
+    parser.add_argument('--report-batch', type=int, default=50, help='departments per report batch (default 50)')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=3)
+    parser.add_argument('--per-domain', type=int, default=2)
+    parser.add_argument('--domains', type=int, default=10, help='recipient domains to spread mail over (default 10)')
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    parser.add_argument('--smtp-latency-ms', type=float, default=20, help='sink delay per message (default 20)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of sends refused with 451')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='share of sends refused with 550')
+    parser.add_argument('--retry-base', type=float, default=1, help='first retry backoff in seconds (default 1)')
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    parser.add_argument('--database', default='petition_system_email_bench')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the Python heap peak (slower)')
+    parser.add_argument('--verbose', action='store_true', help="keep the email modules' per-message logging")
+    args = parser.parse_args()
+
+    if args.database == getattr(Config, 'MONGO_DB_NAME', 'petition_system'):
+        parser.error('--database must not be the application database; it is dropped')
+
+    sink = SMTPSink(None, args.smtp_latency_ms / 1000, args.fail_rate, args.reject_rate, args.seed)
+    configure(args, sink.port)
+
+    import email_utils
+    from database import get_client
+    from email_outbox import EMAIL_MAX_ATTEMPTS
+    from indexes import INDEX_REGISTRY, ensure_indexes
+
+    get_client().drop_database(args.database)
+    ensure_indexes(email_utils.db, [spec for spec in INDEX_REGISTRY if spec.collection == 'email_outbox'],
+                   verbose=False)
+
+    tracker = Tracker(args.domains, EMAIL_MAX_ATTEMPTS)
+    sink.on_message = tracker.on_message
+    threading.Thread(target=sink.serve_forever, name='smtp-sink', daemon=True).start()
+
+    def timed(scenario, addresses, call):
+        started = time.monotonic()
+        try:
+            call()
+        except Exception:
+            tracker.failed_to_enqueue(addresses)
+            raise
+        tracker.enqueued(scenario, addresses, started, time.monotonic())
+
+    def send_email():
+        to_email = tracker.address('send_email')
+        timed('send_email', [to_email], lambda: email_utils.send_email(
+            to_email, 'Benchmark alert', '<p>Benchmark message</p>'
+        ))
+
+    def send_otp_email():
+        to_email = tracker.address('send_otp_email')
+        timed('send_otp_email', [to_email], lambda: email_utils.send_otp_email(to_email, '482913', 'Priya Raman'))
+
+    def send_reports():
+        # The enqueue half of queue_daily_reports: one batch into the outbox
+        addresses = [tracker.address('report') for _ in range(args.report_batch)]
+        messages = [
+            {'to_email': to_email, 'subject': 'Benchmark daily summary', 'template': 'daily_summary',
+             'context': {'summary_data': SUMMARY_DATA}}
+            for to_email in addresses
+        ]
+        timed('report', addresses, lambda: email_utils.send_templated_emails(messages, lane='bulk'))
+
+    drivers = [
+        ('send_email', args.email_rate, send_email),
+        ('send_otp_email', args.otp_rate, send_otp_email),
+        ('report', 1 / args.report_interval if args.report_interval > 0 else 0, send_reports)
+    ]
+
+    print(f"Sink 127.0.0.1:{sink.port}  latency {args.smtp_latency_ms:g} ms  fail {args.fail_rate:.0%}  "
+          f"reject {args.reject_rate:.0%}   workers {args.workers}  pool {args.pool_size}  "
+          f"per-domain {args.per_domain}  domains {args.domains}", file=sys.stderr)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_mb()
+    stop = threading.Event()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    started = time.monotonic()
+    with quiet:
+        threads = [
+            threading.Thread(target=drive, args=(name, rate, args.duration, call, stop), name=f'drive-{name}')
+            for name, rate, call in drivers
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+            load_finished = time.monotonic()
+            print(f"Load done after {load_finished - started:.1f}s; draining {tracker.outstanding()} message(s)",
+                  file=sys.stderr)
+            drain_deadline = load_finished + args.drain_timeout
+            while tracker.outstanding() and time.monotonic() < drain_deadline:
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            stop.set()
+        finished = time.monotonic()
+        dispatcher = email_utils.email_dispatcher.snapshot()
+        email_utils.email_dispatcher.shutdown(5)
+        email_utils.smtp_pool.close()
+    heap_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.tracemalloc else None
+    sink.shutdown()
+    get_client().drop_database(args.database)
+
+    results = tracker.results()
+    print(f"{'scenario':<16}{'queued':>8}{'sent':>7}{'dead':>6}{'lost':>6}{'msg/s':>8}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'enq p50':>9}{'enq p99':>9}")
+    for scenario in SCENARIOS + ('total',):
+        rows = [r for r in results if scenario == 'total' or r['scenario'] == scenario]
+        if not rows:
+            continue
+        delivered = [r for r in rows if r['outcome'] == 'delivered']
+        latencies = [(r['finished_at'] - r['enqueued_at']) * 1000 for r in delivered if r['enqueued_at']]
+        if scenario == 'total':
+            enqueue = [s for samples in tracker.enqueue_seconds.values() for s in samples]
+        else:
+            enqueue = tracker.enqueue_seconds[scenario]
+        enqueue = [s * 1000 for s in enqueue]
+        span = (max(r['finished_at'] for r in delivered) - started) if delivered else 0
+        print(f"{scenario:<16}{len(rows):>8}{len(delivered):>7}"
+              f"{sum(1 for r in rows if r['outcome'] == 'dead'):>6}"
+              f"{sum(1 for r in rows if r['outcome'] is None):>6}"
+              f"{(len(delivered) / span if span else 0):>8.1f}"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 99):>9.1f}"
+              f"{(max(latencies) if latencies else 0):>9.1f}"
+              f"{percentile(enqueue, 50):>9.2f}{percentile(enqueue, 99):>9.2f}")
+
+    print(f"\nRun {finished - started:.1f}s   enqueue errors {tracker.errors}   "
+          f"sink {sink.stats}   smtp pool {email_utils.smtp_pool.stats}")
+    print(f"Dispatcher: delivered {dispatcher['delivered']}  retried {dispatcher['retried']}  "
+          f"dead {dispatcher['dead']}  lost leases {dispatcher['lost_leases']}")
+    for lane, stats in dispatcher['lanes'].items():
+        print(f"  {lane:<14} queueing delay p50 {stats['p50_delay_seconds'] * 1000:.1f} ms  "
+              f"p99 {stats['p99_delay_seconds'] * 1000:.1f} ms  SLO breaches {stats['slo_breaches']}")
+    memory = f"Memory: RSS {rss_before:.1f} -> {rss_mb():.1f} MB, peak {peak_rss_mb():.1f} MB"
+    if heap_peak is not None:
+        memory += f", Python heap peak {heap_peak:.1f} MB"
+    print(memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Render time and output size of the compiled email templates against the
+f-string functions they replaced.
+
+The old functions are loaded from git history, so nothing else is needed:
+
+    python benchmarks/bench_email_templates.py [--iterations 2000] [--baseline REV]
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, UTC
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import email_templates  # noqa: E402
+
+PETITION = {
+    'ticket_id': 'PET-20261017-4821',
+    'title': 'Streetlights out on Lake Road for two weeks',
+    'description': 'Six streetlights between the school and the bus depot have been out since the 3rd. '
+                   'Children walk this stretch after evening classes & it is completely dark.',
+    'department': 'Public Works',
+    'category': 'Infrastructure',
+    'urgency': 'high',
+    'status': 'in_progress',
+    'full_name': 'Priya Raman',
+    'name': 'Priya Raman',
+    'email': 'priya@example.com',
+    'created_at': '2026-10-15 09:12:44'
+}
+
+LISTED = [
+    {'ticket_id': f'PET-20261017-{i:04d}', 'title': f'Petition {i}', 'urgency': u, 'category': 'Infrastructure'}
+    for i, u in enumerate(['high', 'medium', 'low', 'high', 'medium', 'low'])
+]
+
+# Template name -> (args, kwargs) for both implementations
+CASES = {
+    'otp': (('Priya Raman', '482913'), {}),
+    'welcome': (('Priya Raman',), {}),
+    'petition_submission': (('Priya Raman', PETITION['ticket_id'], PETITION['title']), {}),
+    'petition_status_update': (('Priya Raman', PETITION['ticket_id'], PETITION['title'], 'pending', 'resolved'), {}),
+    'high_urgency_alert': ((PETITION,), {}),
+    'daily_summary': (({
+        'department_name': 'Public Works', 'date': 'October 17, 2026', 'new_petitions': 14,
+        'resolved_today': 6, 'pending': 31, 'high_urgency': 4,
+        'high_urgency_petitions': LISTED[:5], 'new_today': LISTED
+    },), {}),
+    'weekly_report': (({
+        'department_name': 'Public Works', 'week_range': 'Oct 10 - Oct 17', 'total_petitions': 52,
+        'resolved': 30, 'in_progress': 12, 'pending': 10, 'resolution_rate': 57.7,
+        'avg_response_time': '2.5', 'satisfaction_score': 4.5
+    },), {}),
+    'deadline_reminder': ((PETITION, 17.4), {}),
+    'rejection': ((PETITION, 'Streetlights on Lake Road are maintained by the state highways board.'), {})
+}
+
+FUNCTIONS = {
+    'otp': 'get_otp_email_template',
+    'welcome': 'get_welcome_email_template',
+    'petition_submission': 'get_petition_submission_email_template',
+    'petition_status_update': 'get_petition_status_update_email_template',
+    'high_urgency_alert': 'get_high_urgency_alert_template',
+    'daily_summary': 'get_daily_summary_template',
+    'weekly_report': 'get_weekly_report_template',
+    'deadline_reminder': 'get_deadline_reminder_template',
+    'rejection': 'get_rejection_email_template'
+}
+
+LEGACY_FILES = ('email_utils.py', 'email_templates.py')
+
+
+def _git(*args):
+    return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+
+def find_baseline():
+    """Last revision whose email_templates.py still had the f-string helpers"""
+    revision = _git('log', '-1', '--format=%H', '-S', 'def _render_petition_list', '--', 'email_templates.py').strip()
+    if 'def _render_petition_list' in _git('show', f'{revision}:email_templates.py'):
+        return revision
+    return f'{revision}^'
+
+
+def load_legacy(revision):
+    """The template functions (and their helpers) as they were at `revision`"""
+    namespace = {'datetime': datetime, 'UTC': UTC}
+    for path in LEGACY_FILES:
+        tree = ast.parse(_git('show', f'{revision}:{path}'))
+        functions = [
+            node for node in tree.body
+            if isinstance(node, ast.FunctionDef) and (node.name.endswith('_template') or node.name.startswith('_render_'))
+        ]
+        exec(compile(ast.Module(body=functions, type_ignores=[]), path, 'exec'), namespace)
+    return namespace
+
+
+def time_per_call(render, args, kwargs, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render(*args, **kwargs)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def cold_compile_ms():
+    """Time to load and compile every template from disk, as on the first render in a process"""
+    email_templates.environment.cache.clear()
+    start = time.perf_counter()
+    for name in CASES:
+        email_templates.environment.get_template(f'{name}.html')
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--baseline', help='git revision with the f-string templates (default: found from history)')
+    args = parser.parse_args()
+
+    baseline = args.baseline or find_baseline()
+    legacy = load_legacy(baseline)
+    compile_ms = cold_compile_ms()
+
+    print(f"Baseline: {baseline[:12]}   iterations: {args.iterations}   cold compile of all templates: {compile_ms:.1f} ms")
+    print(f"{'template':<24}{'f-string µs':>12}{'engine µs':>12}{'speedup':>9}{'f-string B':>12}{'engine B':>10}{'size':>8}")
+    totals = [0.0, 0.0, 0, 0]
+    for name, (call_args, call_kwargs) in CASES.items():
+        old = legacy[FUNCTIONS[name]]
+        new = getattr(email_templates, FUNCTIONS[name])
+        old_us = time_per_call(old, call_args, call_kwargs, args.iterations)
+        new_us = time_per_call(new, call_args, call_kwargs, args.iterations)
+        old_size = len(old(*call_args, **call_kwargs).encode())
+        new_size = len(new(*call_args, **call_kwargs).encode())
+        totals = [totals[0] + old_us, totals[1] + new_us, totals[2] + old_size, totals[3] + new_size]
+        print(f"{name:<24}{old_us:>12.1f}{new_us:>12.1f}{old_us / new_us:>8.2f}x{old_size:>12}{new_size:>10}"
+              f"{(new_size - old_size) / old_size:>+8.0%}")
+    print(f"{'total':<24}{totals[0]:>12.1f}{totals[1]:>12.1f}{totals[0] / totals[1]:>8.2f}x{totals[2]:>12}{totals[3]:>10}"
+          f"{(totals[3] - totals[2]) / totals[2]:>+8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Regression check: the single-pass department analytics aggregation must
+report the same numbers as the per-metric count_documents queries it replaced.
+
+The baseline is the original route body, unchanged apart from taking the
+clock as an argument. Every metric must match it except trend_data: the
+trend intentionally moved from overlapping 30-day windows to calendar
+months, so it is checked separately against per-month count_documents.
+
+The numbers are checked twice per department: from the aggregation
+itself, and through GET /api/department/analytics with that department
+logged in, so a broken route fails the check too.
+
+Run against a populated database:
+    python check_analytics.py [days]
+Exits non-zero if any department's numbers differ or the route fails.
+"""
+import sys
+from datetime import datetime, UTC, timedelta
+
+from analytics import department_analytics, trend_months
+
+
+def legacy_department_analytics(db, dept_name, days, now):
+    """The original count_documents implementation of the analytics route.
+
+    Kept as it was, except that `now` replaces each datetime.now() call so
+    both sides are measured from the same instant.
+    """
+    start_date = now - timedelta(days=days)
+    
+    # Total petitions in time range
+    total_petitions = db.petitions.count_documents({
+        'department': dept_name,
+        'created_at': {'$gte': start_date}
+    })
+    
+    # Previous period for comparison
+    prev_start = start_date - timedelta(days=days)
+    prev_petitions = db.petitions.count_documents({
+        'department': dept_name,
+        'created_at': {'$gte': prev_start, '$lt': start_date}
+    })
+    
+    # Calculate trend
+    petition_trend = 0
+    if prev_petitions > 0:
+        petition_trend = round(((total_petitions - prev_petitions) / prev_petitions) * 100, 1)
+    
+    # Resolved petitions
+    resolved_petitions = db.petitions.count_documents({
+        'department': dept_name,
+        'status': 'resolved',
+        'created_at': {'$gte': start_date}
+    })
+    
+    # Resolution rate
+    resolution_rate = 0
+    if total_petitions > 0:
+        resolution_rate = round((resolved_petitions / total_petitions) * 100, 1)
+    
+    # Previous resolution rate
+    prev_resolved = db.petitions.count_documents({
+        'department': dept_name,
+        'status': 'resolved',
+        'created_at': {'$gte': prev_start, '$lt': start_date}
+    })
+    prev_resolution_rate = 0
+    if prev_petitions > 0:
+        prev_resolution_rate = round((prev_resolved / prev_petitions) * 100, 1)
+    
+    resolution_trend = round(resolution_rate - prev_resolution_rate, 1)
+    
+    # Status distribution
+    status_counts = {
+        'pending': db.petitions.count_documents({'department': dept_name, 'status': 'pending'}),
+        'in_progress': db.petitions.count_documents({'department': dept_name, 'status': 'in_progress'}),
+        'resolved': db.petitions.count_documents({'department': dept_name, 'status': 'resolved'}),
+        'rejected': db.petitions.count_documents({'department': dept_name, 'status': 'rejected'})
+    }
+    
+    # Category distribution
+    pipeline = [
+        {'$match': {'department': dept_name}},
+        {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1}},
+        {'$limit': 5}
+    ]
+    categories = list(db.petitions.aggregate(pipeline))
+    
+    # Trend data (last 6 months)
+    trend_data = []
+    for i in range(5, -1, -1):
+        month_start = now - timedelta(days=i*30)
+        month_end = now - timedelta(days=(i-1)*30) if i > 0 else now
+        
+        submitted = db.petitions.count_documents({
+            'department': dept_name,
+            'created_at': {'$gte': month_start, '$lt': month_end}
+        })
+        
+        resolved = db.petitions.count_documents({
+            'department': dept_name,
+            'status': 'resolved',
+            'created_at': {'$gte': month_start, '$lt': month_end}
+        })
+        
+        trend_data.append({
+            'month': month_start.strftime('%b'),
+            'submitted': submitted,
+            'resolved': resolved
+        })
+    
+    # Urgency distribution
+    high_urgency = db.petitions.count_documents({'department': dept_name, 'urgency': 'high'})
+    
+    return {
+        'metrics': {
+            'total_petitions': total_petitions,
+            'petition_trend': petition_trend,
+            'resolution_rate': resolution_rate,
+            'resolution_trend': resolution_trend,
+            'avg_response_time': 2.3,  # Can be calculated from actual data
+            'response_trend': -0.5,
+            'satisfaction_score': 4.2,  # Can be from user ratings
+            'satisfaction_trend': 0.3
+        },
+        'status_distribution': status_counts,
+        'category_distribution': [{'name': cat['_id'], 'count': cat['count']} for cat in categories],
+        'trend_data': trend_data,
+        'performance': {
+            'first_response': '1.8h',
+            'sla_compliance': 95,
+            'escalated_cases': high_urgency,
+            'reopened_petitions': db.petitions.count_documents({
+                'department': dept_name,
+                'status': 'in_progress',
+                'updated_at': {'$exists': True}
+            })
+        }
+    }
+
+
+def calendar_month_trend(db, dept_name, now):
+    """The intended trend_data: submitted and resolved petitions per calendar month (UTC)"""
+    months = trend_months(now)
+    trend = []
+    for index, month_start in enumerate(months):
+        month_end = months[index + 1] if index + 1 < len(months) else now + timedelta(days=1)
+        trend.append({
+            'month': month_start.strftime('%b'),
+            'submitted': db.petitions.count_documents({
+                'department': dept_name, 'created_at': {'$gte': month_start, '$lt': month_end}
+            }),
+            'resolved': db.petitions.count_documents({
+                'department': dept_name, 'status': 'resolved',
+                'created_at': {'$gte': month_start, '$lt': month_end}
+            })
+        })
+    return trend
+
+
+def route_analytics(client, dept, days):
+    """The analytics payload served to a logged-in department"""
+    with client.session_transaction() as session:
+        session.clear()
+        session['department_id'] = str(dept['_id'])
+    response = client.get(f'/api/department/analytics?days={days}')
+    if response.status_code != 200:
+        raise RuntimeError(f"GET /api/department/analytics returned {response.status_code}: {response.get_data(as_text=True)}")
+    return response.get_json()
+
+
+def _differences(expected, actual, path=''):
+    """(metric, expected, actual) for every leaf value that differs"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual)):
+            differences += _differences(expected.get(key), actual.get(key), f"{path}.{key}" if path else key)
+        return differences
+    return [] if expected == actual else [(path, expected, actual)]
+
+
+def _category_differences(expected, actual):
+    """The original sort left ties in no particular order (the new one breaks
+    them by name), so categories tied on the last count may differ by name"""
+    if [cat['count'] for cat in expected] != [cat['count'] for cat in actual]:
+        return [('category_distribution', expected, actual)]
+    # Under the limit every category is listed, so no tie can be cut off
+    cutoff = expected[-1]['count'] if len(expected) == 5 else 0
+
+    def above_cutoff(categories):
+        return sorted(str(cat['name']) for cat in categories if cat['count'] > cutoff)
+
+    if above_cutoff(expected) != above_cutoff(actual):
+        return [('category_distribution', expected, actual)]
+    return []
+
+
+def compare(db, dept_name, days, now, actual=None):
+    """List of (metric, expected, actual) mismatches for one department.
+
+    `actual` defaults to the aggregation's own result; pass a payload
+    served by the route to check that instead.
+    """
+    expected = legacy_department_analytics(db, dept_name, days, now)
+    if actual is None:
+        actual = department_analytics(db, dept_name, days, now=now)
+
+    def unchanged(payload):
+        return {key: value for key, value in payload.items() if key not in ('trend_data', 'category_distribution')}
+
+    mismatches = _differences(unchanged(expected), unchanged(actual))
+    mismatches += _category_differences(expected['category_distribution'], actual['category_distribution'])
+
+    # The one intentional change: calendar months instead of 30-day windows
+    trend = calendar_month_trend(db, dept_name, now)
+    if trend != actual['trend_data']:
+        mismatches.append(('trend_data (calendar months)', trend, actual['trend_data']))
+    return mismatches
+
+
+if __name__ == '__main__':
+    from database import get_db
+    from app import app
+
+    db = get_db()
+    client = app.test_client()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    now = datetime.now(UTC)
+    failures = 0
+
+    for dept in db.departments.find({}, {'name': 1}):
+        try:
+            mismatches = compare(db, dept['name'], days, now)
+            mismatches += [
+                (f"route {name}", want, got)
+                for name, want, got in compare(db, dept['name'], days, now, route_analytics(client, dept, days))
+            ]
+        except Exception as e:
+            mismatches = [('error', 'no exception', str(e))]
+        if mismatches:
+            failures += 1
+            print(f"❌ {dept['name']}")
+            for name, want, got in mismatches:
+                print(f"   {name}: expected {want}, got {got}")
+        else:
+            print(f"✅ {dept['name']}")
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,99 @@
+"""
+Write-maintained petition counts per department and status
+"""
+from datetime import datetime, UTC
+
+from pymongo import UpdateOne, ReplaceOne
+
+# Marks a database whose counters have been built from its petitions
+COUNTERS_MIGRATION = 'petition_counters'
+
+
+def _key(department, status):
+    return {'department': department, 'status': status}
+
+
+def increment_status(db, department, status, amount=1):
+    """Atomically add `amount` to a department's count for `status`"""
+    db.petition_counters.update_one(
+        _key(department, status),
+        {'$inc': {'count': amount}},
+        upsert=True
+    )
+
+
+def move_status(db, department, old_status, new_status):
+    """Record a petition moving from `old_status` to `new_status`"""
+    if old_status == new_status:
+        return
+    db.petition_counters.bulk_write([
+        UpdateOne(_key(department, old_status), {'$inc': {'count': -1}}, upsert=True),
+        UpdateOne(_key(department, new_status), {'$inc': {'count': 1}}, upsert=True)
+    ], ordered=True)
+
+
+def delete_department_counters(db, department):
+    db.petition_counters.delete_many({'department': department})
+
+
+def get_status_counts(db, department):
+    """Status -> count for a department, plus 'total', from a single indexed read"""
+    counts = {
+        counter['status']: counter.get('count', 0)
+        for counter in db.petition_counters.find({'department': department}, {'status': 1, 'count': 1})
+    }
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+def rebuild_counters(db, department=None):
+    """Recompute counters from the petitions collection.
+
+    Writes that land while the rebuild runs may be counted twice or not at
+    all, so run it off-peak, or for a single department when it is created.
+    Returns the number of counters written.
+    """
+    match = {'department': department} if department else {}
+    totals = db.petitions.aggregate([
+        {'$match': match},
+        {'$group': {'_id': {'department': '$department', 'status': '$status'}, 'count': {'$sum': 1}}}
+    ])
+
+    operations = []
+    seen = []
+    for item in totals:
+        key = _key(item['_id'].get('department'), item['_id'].get('status'))
+        seen.append(key)
+        operations.append(ReplaceOne(key, dict(key, count=item['count']), upsert=True))
+
+    if operations:
+        db.petition_counters.bulk_write(operations, ordered=False)
+
+    # Drop counters for department/status pairs that no longer have petitions
+    stale = dict(match)
+    if seen:
+        stale['$nor'] = seen
+    db.petition_counters.delete_many(stale)
+    return len(operations)
+
+
+def migrate_counters(db):
+    """Build the counters once on a database that has petitions from before them.
+
+    Until then every existing petition is missing from the counts, and moving
+    one would take its old status's counter below zero. Returns the number
+    of counters written, or None if the migration had already run.
+    """
+    if db.migrations.find_one({'_id': COUNTERS_MIGRATION}):
+        return None
+    written = rebuild_counters(db)
+    mark_counters_migrated(db)
+    return written
+
+
+def mark_counters_migrated(db):
+    db.migrations.update_one(
+        {'_id': COUNTERS_MIGRATION},
+        {'$set': {'completed_at': datetime.now(UTC)}},
+        upsert=True
+    )
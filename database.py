@@ -0,0 +1,201 @@
+"""
+Shared MongoDB connection management for the Petition Management System
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import MongoClient, monitoring
+from config import Config
+
+# Pool configuration (override any of these in config.py)
+MONGO_DB_NAME = getattr(Config, 'MONGO_DB_NAME', 'petition_system')
+MONGO_MAX_POOL_SIZE = getattr(Config, 'MONGO_MAX_POOL_SIZE', 100)
+MONGO_MIN_POOL_SIZE = getattr(Config, 'MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_IDLE_TIME_MS = getattr(Config, 'MONGO_MAX_IDLE_TIME_MS', 60000)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = getattr(Config, 'MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = getattr(Config, 'MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+
+# Number of recent checkout waits kept for percentile reporting
+CHECKOUT_SAMPLE_SIZE = 1000
+
+
+class PoolCheckoutListener(monitoring.ConnectionPoolListener):
+    """Records how long each thread waits to check a connection out of the pool"""
+
+    def __init__(self):
+        self._reinit_after_fork()
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def _reinit_after_fork(self):
+        # Fresh lock and state without touching the old lock, which a thread
+        # of the parent may have held at fork time
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=CHECKOUT_SAMPLE_SIZE)
+        self._clear()
+
+    def _clear(self):
+        self._samples.clear()
+        self.checkouts = 0
+        self.failures = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.connections_created = 0
+        self.connections_closed = 0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+        self._local.started = None
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self._samples.append(wait_ms)
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        with self._lock:
+            self.failures += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    # Events we don't track, but the listener interface requires
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            checkouts = self.checkouts
+            stats = {
+                'checkouts': checkouts,
+                'checkout_failures': self.failures,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'avg_wait_ms': round(self.total_wait_ms / checkouts, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3)
+            }
+
+        def percentile(pct):
+            if not samples:
+                return 0.0
+            index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+            return round(samples[index], 3)
+
+        stats['p50_wait_ms'] = percentile(50)
+        stats['p99_wait_ms'] = percentile(99)
+        return stats
+
+
+checkout_listener = PoolCheckoutListener()
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use.
+
+    The client is keyed by PID so a pre-forking server never shares sockets
+    between the master and its workers: each child builds its own pool the
+    first time it touches the database.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(
+                Config.MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                event_listeners=[checkout_listener]
+            )
+            _client_pid = pid
+    return _client
+
+
+def get_db():
+    """Return the application database on this process's client"""
+    return get_client()[MONGO_DB_NAME]
+
+
+def _reset_after_fork():
+    # The inherited client belongs to the parent; drop it without closing
+    # so the child lazily opens its own pool.
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    checkout_listener._reinit_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _LazyDatabase:
+    """Module-level `db` handle that resolves to the current process's database"""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = _LazyDatabase()
+
+
+def get_pool_stats():
+    """Pool configuration plus checkout wait statistics for this process"""
+    return {
+        'pid': os.getpid(),
+        'connected': _client is not None and _client_pid == os.getpid(),
+        'config': {
+            'max_pool_size': MONGO_MAX_POOL_SIZE,
+            'min_pool_size': MONGO_MIN_POOL_SIZE,
+            'max_idle_time_ms': MONGO_MAX_IDLE_TIME_MS,
+            'wait_queue_timeout_ms': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'server_selection_timeout_ms': MONGO_SERVER_SELECTION_TIMEOUT_MS
+        },
+        'checkout': checkout_listener.stats()
+    }
@@ -0,0 +1,295 @@
+"""
+In-process deadline scheduler for petition reminder and escalation events
+"""
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, UTC, timedelta
+
+from pymongo import UpdateOne
+
+from models import OPEN_STATUSES
+
+# Events fired for each open petition, by how long before the deadline they fire
+DEADLINE_EVENTS = [
+    ('reminder_48h', timedelta(hours=48)),
+    ('reminder_24h', timedelta(hours=24)),
+    ('overdue', timedelta(0))
+]
+
+LONGEST_LEAD = max(lead for _, lead in DEADLINE_EVENTS)
+
+# Escalation for a petition that went overdue while no scheduler was running;
+# claimed under the same marker as 'overdue', so it fires at most once
+MISSED_OVERDUE = 'overdue_missed'
+
+# Recorded in the `migrations` collection once petitions that were already
+# overdue before the scheduler existed have been marked as escalated
+DEADLINE_EVENTS_MIGRATION = 'deadline_events'
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def _normalize(value):
+    """Aware UTC datetime at the millisecond precision MongoDB stores"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _marker(event, deadline):
+    if event == MISSED_OVERDUE:
+        event = 'overdue'
+    return f"{event}:{deadline.isoformat()}"
+
+
+def migrate_deadline_events(db, before):
+    """Mark open petitions overdue before `before` as escalated, once.
+
+    A database that predates the scheduler has no event markers, so without
+    this its whole backlog of overdue petitions would be escalated as missed
+    on the first start. Returns the number of petitions marked, or None if
+    the migration had already run.
+    """
+    if db.migrations.find_one({'_id': DEADLINE_EVENTS_MIGRATION}):
+        return None
+    cursor = db.petitions.find(
+        {'status': {'$in': OPEN_STATUSES}, 'deadline': {'$lt': before}},
+        {'deadline': 1}
+    )
+    marked = 0
+    operations = []
+    for petition in cursor:
+        marker = _marker('overdue', _normalize(petition['deadline']))
+        operations.append(UpdateOne({'_id': petition['_id']}, {'$addToSet': {'deadline_events': marker}}))
+        if len(operations) == MIGRATION_BATCH_SIZE:
+            marked += db.petitions.bulk_write(operations, ordered=False).matched_count
+            operations = []
+    if operations:
+        marked += db.petitions.bulk_write(operations, ordered=False).matched_count
+    db.migrations.update_one(
+        {'_id': DEADLINE_EVENTS_MIGRATION},
+        {'$set': {'completed_at': datetime.now(UTC)}},
+        upsert=True
+    )
+    return marked
+
+
+class DeadlineScheduler:
+    """Min-heap of upcoming deadline events, fed by an indexed query and by writes.
+
+    Only events due within `horizon` are kept in memory; the window is refilled
+    from the status+deadline index every `refill_interval`. Routes call
+    `schedule()`/`cancel()` when a petition is created, its deadline moves or
+    its status changes, so the heap stays current between refills.
+
+    Each event is claimed in the petition document before the handler runs, so
+    with several worker processes (each running a scheduler) it fires once.
+    Escalations missed while no scheduler ran are handed to the handler as
+    MISSED_OVERDUE, so it can batch them.
+    """
+
+    def __init__(self, db, handler, horizon=timedelta(hours=6), refill_interval=timedelta(minutes=30), enabled=True):
+        self.db = db
+        self.handler = handler
+        self.horizon = horizon
+        self.refill_interval = refill_interval
+        self.enabled = enabled
+        self._reset()
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._deadlines = {}  # ticket_id -> deadline currently scheduled
+        self._window_end = None
+        self._next_refill = None
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    # ----- public API -----
+
+    def start(self):
+        """Start the scheduler thread for this process (safe to call repeatedly).
+
+        Does nothing when the scheduler is disabled, e.g. in web processes
+        when a separate process handles deadlines.
+        """
+        if not self.enabled:
+            return
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+        if self._pid is not None and self._pid != os.getpid():
+            # Forked child: the parent's thread and heap don't exist here
+            self._reset()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='deadline-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+    def schedule(self, ticket_id, deadline, now=None):
+        """(Re)schedule a petition's events for `deadline`"""
+        if deadline is None:
+            self.cancel(ticket_id)
+            return
+        if not self.enabled:
+            return
+        self.start()
+        now = now or datetime.now(UTC)
+        deadline = _normalize(deadline)
+        with self._condition:
+            self._deadlines[ticket_id] = deadline
+            if self._window_end is not None:
+                self._push_events(ticket_id, deadline, now, self._window_end, catch_up=False)
+            self._condition.notify_all()
+
+    def cancel(self, ticket_id):
+        """Drop any pending events for a petition (e.g. it was resolved)"""
+        with self._condition:
+            # Heap entries for a ticket are ignored once it no longer maps to their deadline
+            self._deadlines.pop(ticket_id, None)
+
+    # ----- internals -----
+
+    def _push_events(self, ticket_id, deadline, now, window_end, catch_up=True):
+        passed = [(event, deadline - lead) for event, lead in DEADLINE_EVENTS if deadline - lead <= now]
+        upcoming = [(event, deadline - lead) for event, lead in DEADLINE_EVENTS if now < deadline - lead <= window_end]
+
+        # When catching up (startup or refill), the latest threshold that has
+        # already passed fires immediately; earlier ones are moot. A petition
+        # that is created or extended inside a threshold doesn't get a reminder
+        # for it, but still escalates if it is already overdue.
+        if passed:
+            event, _ = max(passed, key=lambda item: item[1])
+            if catch_up or event == 'overdue':
+                heapq.heappush(self._heap, (now, next(self._sequence), ticket_id, event, deadline))
+        for event, fire_at in upcoming:
+            heapq.heappush(self._heap, (fire_at, next(self._sequence), ticket_id, event, deadline))
+
+    def _refill(self, now):
+        """Load petitions with events due before the new window end"""
+        window_end = now + self.horizon
+        previous_end = self._window_end
+        cursor = self.db.petitions.find(
+            {
+                'status': {'$in': OPEN_STATUSES},
+                'deadline': {'$gte': now - self.horizon, '$lte': window_end + LONGEST_LEAD}
+            },
+            {'ticket_id': 1, 'deadline': 1}
+        )
+        loaded = [(petition['ticket_id'], _normalize(petition['deadline'])) for petition in cursor]
+        missed = self._missed_escalations(now - self.horizon) if previous_end is None else []
+
+        with self._condition:
+            for ticket_id, deadline in missed:
+                self._deadlines[ticket_id] = deadline
+                heapq.heappush(self._heap, (now, next(self._sequence), ticket_id, MISSED_OVERDUE, deadline))
+            for ticket_id, deadline in loaded:
+                known = self._deadlines.get(ticket_id)
+                if known == deadline and previous_end is not None:
+                    # Events up to the old window are already queued; add the new slice
+                    self._push_new_slice(ticket_id, deadline, previous_end, window_end)
+                    continue
+                self._deadlines[ticket_id] = deadline
+                self._push_events(ticket_id, deadline, now, window_end)
+            self._window_end = window_end
+            self._next_refill = now + self.refill_interval
+
+    def _missed_escalations(self, before):
+        """Open petitions that went overdue before `before` and were never escalated.
+
+        Run on a process's first refill, so escalations that fell due while
+        no scheduler was running (downtime longer than the horizon) still go
+        out. Petitions escalated for their current deadline are skipped here
+        and by the claim. On the very first start the backlog is marked
+        instead (see migrate_deadline_events), so nothing is returned.
+        """
+        marked = migrate_deadline_events(self.db, before)
+        if marked is not None:
+            print(f"⏰ Marked {marked} petitions overdue before the scheduler existed as escalated")
+            return []
+        cursor = self.db.petitions.find(
+            {'status': {'$in': OPEN_STATUSES}, 'deadline': {'$lt': before}},
+            {'ticket_id': 1, 'deadline': 1, 'deadline_events': 1}
+        )
+        missed = []
+        for petition in cursor:
+            deadline = _normalize(petition['deadline'])
+            if _marker('overdue', deadline) not in petition.get('deadline_events', []):
+                missed.append((petition['ticket_id'], deadline))
+        return missed
+
+    def _push_new_slice(self, ticket_id, deadline, start, end):
+        for event, lead in DEADLINE_EVENTS:
+            fire_at = deadline - lead
+            if start < fire_at <= end:
+                heapq.heappush(self._heap, (fire_at, next(self._sequence), ticket_id, event, deadline))
+
+    def _claim(self, ticket_id, event, deadline):
+        """Mark the event as sent; returns the petition only if this call won the claim.
+
+        `last_reminded_at` keeps the manual reminder run from repeating it.
+        """
+        marker = _marker(event, deadline)
+        return self.db.petitions.find_one_and_update(
+            {
+                'ticket_id': ticket_id,
+                'status': {'$in': OPEN_STATUSES},
+                'deadline': deadline,
+                'deadline_events': {'$ne': marker}
+            },
+            {
+                '$addToSet': {'deadline_events': marker},
+                '$set': {'last_reminded_at': datetime.now(UTC)}
+            }
+        )
+
+    def _due_events(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, ticket_id, event, deadline = heapq.heappop(self._heap)
+            if self._deadlines.get(ticket_id) == deadline:
+                due.append((ticket_id, event, deadline))
+        # Forget petitions whose last event has been handed out
+        for ticket_id, event, deadline in due:
+            if event in ('overdue', MISSED_OVERDUE):
+                self._deadlines.pop(ticket_id, None)
+        return due
+
+    def _run(self):
+        print("⏰ Deadline scheduler started")
+        while True:
+            now = datetime.now(UTC)
+            if self._next_refill is None or now >= self._next_refill:
+                try:
+                    self._refill(now)
+                except Exception as e:
+                    print(f"❌ Deadline scheduler refill failed: {str(e)}")
+                    with self._condition:
+                        self._next_refill = now + timedelta(minutes=1)
+
+            with self._condition:
+                if self._stopping:
+                    return
+                due = self._due_events(now)
+                if not due:
+                    wake_at = self._next_refill
+                    if self._heap and self._heap[0][0] < wake_at:
+                        wake_at = self._heap[0][0]
+                    self._condition.wait(max(0.0, (wake_at - now).total_seconds()))
+                    continue
+
+            for ticket_id, event, deadline in due:
+                try:
+                    petition = self._claim(ticket_id, event, deadline)
+                    if petition:
+                        self.handler(event, petition)
+                except Exception as e:
+                    print(f"❌ Deadline event {event} failed for {ticket_id}: {str(e)}")
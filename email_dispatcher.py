@@ -0,0 +1,282 @@
+"""
+Multi-worker dispatcher for email in the outbox
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+
+from email_outbox import (
+    enqueue_email, enqueue_emails, claim_email, complete_email, fail_email, outbox_stats, UndeliverableEmail,
+    EMAIL_LANES, DEFAULT_LANE, EMAIL_LANE_WEIGHTS, EMAIL_LANE_SLO_SECONDS
+)
+from smtp_pool import is_permanent_failure
+
+# Number of recent queueing delays kept per lane for percentile reporting
+DELAY_SAMPLE_SIZE = 1000
+
+# Serializes starting workers; kept outside the dispatchers because _reset()
+# replaces their own locks
+_start_lock = threading.Lock()
+
+
+def _reinit_start_lock():
+    # A thread of the parent may have held it at fork time
+    global _start_lock
+    _start_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_start_lock)
+
+
+class LaneScheduler:
+    """Smooth weighted round-robin over the email lanes.
+
+    Each claim tries the lane whose turn it is, then the rest in priority
+    order, so an idle lane's share goes to the others and a backlog of
+    reports can never hold up more than its weight of the claims.
+    """
+
+    def __init__(self, weights, lanes=EMAIL_LANES):
+        self.lanes = list(lanes)
+        self.weights = {lane: max(int(weights.get(lane, 1)), 1) for lane in self.lanes}
+        self._current = {lane: 0 for lane in self.lanes}
+        self._lock = threading.Lock()
+
+    def order(self):
+        """Lanes to try for the next claim"""
+        total = sum(self.weights.values())
+        with self._lock:
+            for lane in self.lanes:
+                self._current[lane] += self.weights[lane]
+            turn = max(self.lanes, key=lambda lane: self._current[lane])
+            self._current[turn] -= total
+        return [turn] + [lane for lane in self.lanes if lane != turn]
+
+
+class LaneDelays:
+    """Queueing delay (queued to first claim) per lane, against the lane's SLO"""
+
+    def __init__(self, slo_seconds, lanes=EMAIL_LANES):
+        self.slo_seconds = slo_seconds
+        self._lock = threading.Lock()
+        self._samples = {lane: deque(maxlen=DELAY_SAMPLE_SIZE) for lane in lanes}
+        self._breaches = {lane: 0 for lane in lanes}
+
+    def record(self, lane, delay_seconds):
+        """Store a sample; True if it broke the lane's SLO"""
+        slo = self.slo_seconds.get(lane)
+        breached = slo is not None and delay_seconds > slo
+        with self._lock:
+            self._samples[lane].append(delay_seconds)
+            if breached:
+                self._breaches[lane] += 1
+        return breached
+
+    def stats(self):
+        with self._lock:
+            snapshot = {lane: (sorted(samples), self._breaches[lane]) for lane, samples in self._samples.items()}
+
+        def percentile(samples, pct):
+            if not samples:
+                return 0.0
+            index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+            return round(samples[index], 3)
+
+        return {
+            lane: {
+                'slo_seconds': self.slo_seconds.get(lane),
+                'samples': len(samples),
+                'p50_delay_seconds': percentile(samples, 50),
+                'p99_delay_seconds': percentile(samples, 99),
+                'max_delay_seconds': round(samples[-1], 3) if samples else 0.0,
+                'slo_breaches': breaches
+            }
+            for lane, (samples, breaches) in snapshot.items()
+        }
+
+
+class EmailDispatcher:
+    """Worker threads claiming messages from the outbox and handing them to `deliver`.
+
+    Messages are written to MongoDB by `submit`, so nothing queued is lost
+    when a process restarts, and any process running workers can send mail
+    queued by any other. A failed send is retried with backoff, and
+    dead-lettered when the server refuses it outright or attempts run out.
+
+    At most `per_domain_limit` messages to one recipient domain are in flight
+    in this process at a time, so a burst to a single provider doesn't trip
+    its rate limits or tie up every worker: saturated domains are left out
+    of the claim query.
+
+    Messages go into priority lanes; workers pick the lane to claim from
+    by weight (see LaneScheduler) and record how long each message waited.
+    """
+
+    def __init__(self, db, deliver, workers=3, per_domain_limit=2, poll_interval=1.0, name='email-worker',
+                 lane_weights=EMAIL_LANE_WEIGHTS, lane_slo_seconds=EMAIL_LANE_SLO_SECONDS):
+        self.db = db
+        self.deliver = deliver
+        self.workers = workers
+        self.per_domain_limit = per_domain_limit
+        self.poll_interval = poll_interval
+        self.name = name
+        self.lanes = LaneScheduler(lane_weights)
+        self.lane_slo_seconds = lane_slo_seconds
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Condition()
+        self._active = defaultdict(int)  # domain -> messages being delivered
+        self._threads = []
+        self._pid = None
+        self._stopping = False
+        self.stats = {'delivered': 0, 'retried': 0, 'dead': 0, 'lost_leases': 0}
+        self.delays = LaneDelays(self.lane_slo_seconds)
+
+    # ----- public API -----
+
+    def start(self):
+        """Start the worker threads for this process (safe to call repeatedly and concurrently)"""
+        if self._threads and self._pid == os.getpid():
+            return
+        with _start_lock:
+            pid = os.getpid()
+            # Another request thread may have started them while this one waited
+            if self._threads and self._pid == pid:
+                return
+            if self._pid is not None and self._pid != pid:
+                # Forked child: the parent's threads don't exist here
+                self._reset()
+            threads = [
+                threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads = threads
+            self._pid = pid
+            for thread in threads:
+                thread.start()
+
+    def running(self):
+        return bool(self._threads) and self._pid == os.getpid() and not self._stopping
+
+    def submit(self, to_email, subject, body=None, lane=DEFAULT_LANE, template=None, context=None):
+        """Store a message in the outbox and wake this process's workers"""
+        message_id = enqueue_email(self.db, to_email, subject, body, lane, template, context)
+        with self._lock:
+            self._lock.notify_all()
+        return message_id
+
+    def submit_many(self, messages):
+        """Store many messages in one outbox write (see enqueue_emails) and wake the workers"""
+        message_ids = enqueue_emails(self.db, messages)
+        with self._lock:
+            self._lock.notify_all()
+        return message_ids
+
+    def depth(self):
+        """Messages waiting in the outbox or being sent, across all processes"""
+        counts = outbox_stats(self.db)['counts']
+        return counts['pending'] + counts['sending']
+
+    def snapshot(self):
+        """Outbox counts plus this process's in-flight sends, counters and lane delays"""
+        snapshot = outbox_stats(self.db)
+        for lane, delays in self.delays.stats().items():
+            snapshot['lanes'][lane].update(delays)
+        with self._lock:
+            snapshot.update({
+                'pid': os.getpid(),
+                'workers': len(self._threads) if self.running() else 0,
+                'per_domain_limit': self.per_domain_limit,
+                'in_flight': {domain: count for domain, count in self._active.items() if count},
+                **self.stats
+            })
+        return snapshot
+
+    def shutdown(self, timeout=30):
+        """Stop claiming mail and wait up to `timeout` seconds for in-flight sends.
+
+        Unsent messages stay in the outbox for the next worker.
+        """
+        with self._lock:
+            self._stopping = True
+            self._lock.notify_all()
+        if self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        finished = not any(thread.is_alive() for thread in self._threads)
+        if not finished:
+            print("⚠️ Email dispatcher stopped with sends in flight; they are retried when their leases expire")
+        return finished
+
+    # ----- internals -----
+
+    def _run(self):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                saturated = [domain for domain, count in self._active.items() if count >= self.per_domain_limit]
+            try:
+                message = self._claim(worker, saturated)
+            except Exception as e:
+                print(f"❌ Email worker could not claim from the outbox: {str(e)}")
+                message = None
+            if message is None:
+                with self._lock:
+                    if not self._stopping:
+                        self._lock.wait(self.poll_interval)
+                continue
+
+            domain = message['domain']
+            with self._lock:
+                self._active[domain] += 1
+            try:
+                self._deliver_one(message)
+            except Exception as e:
+                # Recording the outcome failed; the lease expires and the message is retried
+                print(f"❌ Email worker could not update the outbox: {str(e)}")
+            finally:
+                with self._lock:
+                    self._active[domain] -= 1
+                    if not self._active[domain]:
+                        del self._active[domain]
+                    # A domain slot freed up
+                    self._lock.notify_all()
+
+    def _claim(self, worker, saturated):
+        for lane in self.lanes.order():
+            message = claim_email(self.db, worker, lane, exclude_domains=saturated)
+            if message is None:
+                continue
+            if message['attempts'] == 1:
+                # Retries wait out their backoff and digests their window on
+                # purpose; only the wait after a message fell due counts
+                due_at = message.get('due_at', message['created_at']).replace(tzinfo=message['claimed_at'].tzinfo)
+                delay = (message['claimed_at'] - due_at).total_seconds()
+                if self.delays.record(lane, delay):
+                    print(f"⚠️ {lane} email to {message['to_email']} waited {delay:.1f}s "
+                          f"(SLO {self.lane_slo_seconds[lane]}s)")
+            return message
+        return None
+
+    def _deliver_one(self, message):
+        try:
+            self.deliver(message)
+        except Exception as e:
+            # `deliver` logs its own failures
+            permanent = isinstance(e, UndeliverableEmail) or is_permanent_failure(e)
+            outcome = fail_email(self.db, message, e, permanent=permanent)
+            if outcome == 'dead':
+                print(f"☠️ Email to {message['to_email']} dead-lettered after {message['attempts']} attempt(s)")
+            key = {'pending': 'retried', 'dead': 'dead', None: 'lost_leases'}[outcome]
+        else:
+            key = 'delivered' if complete_email(self.db, message) else 'lost_leases'
+        with self._lock:
+            self.stats[key] += 1
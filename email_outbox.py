@@ -0,0 +1,241 @@
+"""
+Durable email outbox stored in MongoDB, claimed by email workers under a lease
+"""
+import random
+from datetime import datetime, UTC, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import Config
+
+# Sending attempts before a message is dead-lettered
+EMAIL_MAX_ATTEMPTS = getattr(Config, 'EMAIL_MAX_ATTEMPTS', 6)
+
+# First retry waits about this long; each later one doubles, up to the cap
+EMAIL_RETRY_BASE = timedelta(seconds=getattr(Config, 'EMAIL_RETRY_BASE_SECONDS', 30))
+EMAIL_RETRY_CAP = timedelta(seconds=getattr(Config, 'EMAIL_RETRY_CAP_SECONDS', 3600))
+
+# A claimed message whose worker hasn't reported back by then is claimable again
+EMAIL_LEASE = timedelta(seconds=getattr(Config, 'EMAIL_LEASE_SECONDS', 120))
+
+# Sent messages are removed by a TTL index this long after sending;
+# dead letters are kept until an admin retries or deletes them
+EMAIL_OUTBOX_RETENTION = timedelta(days=getattr(Config, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+
+OUTBOX_STATUSES = ['pending', 'sending', 'sent', 'dead']
+
+# Lanes in priority order: OTPs and replies to a user's own action, then
+# department alerts, then scheduled reports
+EMAIL_LANES = ['transactional', 'alert', 'bulk']
+DEFAULT_LANE = 'alert'
+
+# Share of claims each lane gets while all of them have mail waiting
+EMAIL_LANE_WEIGHTS = getattr(Config, 'EMAIL_LANE_WEIGHTS', {'transactional': 6, 'alert': 3, 'bulk': 1})
+
+# Longest acceptable wait between queueing and a worker picking a message up
+EMAIL_LANE_SLO_SECONDS = getattr(Config, 'EMAIL_LANE_SLO_SECONDS', {'transactional': 10, 'alert': 60, 'bulk': 900})
+
+
+class UndeliverableEmail(Exception):
+    """Raised while delivering a message that no retry could send"""
+
+
+def recipient_domain(to_email):
+    """Lower-cased domain of a recipient address"""
+    return to_email.rsplit('@', 1)[-1].lower()
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt, after `attempts` failed ones.
+
+    Exponential with +/-50% jitter so messages that failed together (an SMTP
+    outage) don't all come back at the same moment.
+    """
+    delay = min(EMAIL_RETRY_CAP, EMAIL_RETRY_BASE * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _outbox_message(now, to_email, subject, body=None, lane=DEFAULT_LANE, template=None, context=None):
+    if lane not in EMAIL_LANES:
+        raise ValueError(f"Unknown email lane: {lane}")
+    if (body is None) == (template is None):
+        raise ValueError('Pass either body or template')
+    message = {
+        'to_email': to_email,
+        'domain': recipient_domain(to_email),
+        'lane': lane,
+        'subject': subject,
+        'status': 'pending',
+        'attempts': 0,
+        'available_at': now,
+        'created_at': now
+    }
+    if template is None:
+        message['body'] = body
+    else:
+        message['template'] = template
+        message['context'] = context or {}
+    return message
+
+
+def enqueue_email(db, to_email, subject, body=None, lane=DEFAULT_LANE, template=None, context=None):
+    """Store a message for delivery in `lane` and return its id.
+
+    Pass either a rendered HTML `body`, or a `template` name and the
+    `context` it is rendered with when the message is sent.
+    """
+    message = _outbox_message(datetime.now(UTC), to_email, subject, body, lane, template, context)
+    result = db.email_outbox.insert_one(message)
+    return result.inserted_id
+
+
+def enqueue_emails(db, messages):
+    """Store many messages in one write and return their ids.
+
+    Each item holds the keyword arguments of enqueue_email. Every message is
+    validated before anything is written.
+    """
+    now = datetime.now(UTC)
+    documents = [_outbox_message(now, **message) for message in messages]
+    if not documents:
+        return []
+    result = db.email_outbox.insert_many(documents, ordered=False)
+    return result.inserted_ids
+
+
+def coalesce_email(db, to_email, subject, template, key, item, window, context=None, lane=DEFAULT_LANE):
+    """Add `item` to the `key` digest waiting for `to_email`, starting one if there is none.
+
+    A digest is held for `window` after its first item and then sent as one
+    message, with the items collected so far in `context['items']`. Items
+    arriving after a worker has claimed it start the next digest.
+    """
+    now = datetime.now(UTC)
+    message = _outbox_message(now, to_email, subject, lane=lane, template=template, context=context)
+    message['available_at'] = message['due_at'] = now + window
+    on_insert = {field: value for field, value in message.items() if field not in ('to_email', 'context')}
+    on_insert.update({f'context.{field}': value for field, value in message['context'].items()})
+
+    for attempt in range(2):
+        try:
+            result = db.email_outbox.find_one_and_update(
+                {'to_email': to_email, 'coalesce_key': key, 'coalescing': True},
+                {'$push': {'context.items': item}, '$setOnInsert': on_insert},
+                projection={'_id': 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return result['_id']
+        except DuplicateKeyError:
+            # Another request started the same digest at the same moment; join it
+            if attempt:
+                raise
+
+
+def claim_email(db, worker, lane, exclude_domains=(), lease=EMAIL_LEASE):
+    """Atomically take the next due message in `lane` for `worker`, or None.
+
+    `available_at` is the retry time of a pending message and the lease
+    expiry of a claimed one, so a message whose worker died is picked up
+    again by the same query. Delivery is therefore at-least-once.
+
+    Claiming a digest closes it to new items (see coalesce_email).
+    """
+    now = datetime.now(UTC)
+    query = {
+        'lane': lane,
+        'status': {'$in': ['pending', 'sending']},
+        'available_at': {'$lte': now}
+    }
+    if exclude_domains:
+        query['domain'] = {'$nin': list(exclude_domains)}
+    return db.email_outbox.find_one_and_update(
+        query,
+        {
+            '$set': {
+                'status': 'sending',
+                'available_at': now + lease,
+                'lease_token': ObjectId(),
+                'worker': worker,
+                'claimed_at': now
+            },
+            '$unset': {'coalescing': ''},
+            '$inc': {'attempts': 1}
+        },
+        sort=[('available_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def complete_email(db, message):
+    """Mark a claimed message sent; False if its lease was lost to another worker"""
+    result = db.email_outbox.update_one(
+        {'_id': message['_id'], 'lease_token': message['lease_token']},
+        {
+            '$set': {'status': 'sent', 'sent_at': datetime.now(UTC)},
+            '$unset': {'lease_token': '', 'last_error': ''}
+        }
+    )
+    return result.modified_count == 1
+
+
+def fail_email(db, message, error, permanent=False):
+    """Schedule a retry with backoff, or dead-letter the message.
+
+    Returns the new status, or None if the lease was lost to another worker.
+    """
+    now = datetime.now(UTC)
+    attempts = message.get('attempts', 1)
+    if permanent or attempts >= EMAIL_MAX_ATTEMPTS:
+        update = {'status': 'dead', 'dead_at': now}
+    else:
+        update = {'status': 'pending', 'available_at': now + retry_delay(attempts)}
+    update['last_error'] = str(error)[:500]
+    result = db.email_outbox.update_one(
+        {'_id': message['_id'], 'lease_token': message['lease_token']},
+        {'$set': update, '$unset': {'lease_token': ''}}
+    )
+    return update['status'] if result.modified_count == 1 else None
+
+
+def retry_dead_letters(db):
+    """Put every dead-lettered message back in the queue with a fresh attempt budget.
+
+    The previous failure and claim are cleared too, so a requeued message
+    no longer looks like it is failing.
+    """
+    result = db.email_outbox.update_many(
+        {'status': 'dead'},
+        {
+            '$set': {'status': 'pending', 'attempts': 0, 'available_at': datetime.now(UTC)},
+            '$unset': {'dead_at': '', 'last_error': '', 'worker': ''}
+        }
+    )
+    return result.modified_count
+
+
+def outbox_stats(db):
+    """Message counts by status, overall and per lane, and each lane's oldest due message"""
+    counts = {status: 0 for status in OUTBOX_STATUSES}
+    lanes = {lane: {'counts': {status: 0 for status in OUTBOX_STATUSES}} for lane in EMAIL_LANES}
+    pipeline = [{'$group': {'_id': {'lane': '$lane', 'status': '$status'}, 'count': {'$sum': 1}}}]
+    for row in db.email_outbox.aggregate(pipeline):
+        lane, status = row['_id'].get('lane'), row['_id']['status']
+        counts[status] += row['count']
+        if lane in lanes:
+            lanes[lane]['counts'][status] += row['count']
+
+    now = datetime.now(UTC)
+    for lane, stats in lanes.items():
+        oldest = db.email_outbox.find_one(
+            {'lane': lane, 'status': 'pending', 'available_at': {'$lte': now}},
+            {'available_at': 1},
+            sort=[('available_at', 1)]
+        )
+        lag = 0.0
+        if oldest:
+            lag = (now - oldest['available_at'].replace(tzinfo=UTC)).total_seconds()
+        stats['oldest_due_seconds'] = round(max(lag, 0.0), 3)
+    return {'counts': counts, 'lanes': lanes}
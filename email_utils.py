@@ -8,13 +8,18 @@ from config import Config
 import random
 import string
 from datetime import datetime, timedelta, UTC
-import threading
-import queue
-from concurrent.futures import ThreadPoolExecutor
-
-# Email queue and thread pool for async processing
-email_queue = queue.Queue()
-email_executor = ThreadPoolExecutor(max_workers=3)
+import atexit
+from smtp_pool import SMTPConnectionPool
+from email_dispatcher import EmailDispatcher
+from email_outbox import DEFAULT_LANE, UndeliverableEmail, coalesce_email
+import email_templates
+from email_templates import (
+    get_otp_email_template,
+    get_welcome_email_template,
+    get_petition_submission_email_template,
+    get_petition_status_update_email_template
+)
+from database import db
 
 # Email configuration
 SMTP_SERVER = getattr(Config, 'SMTP_SERVER', 'smtp.outlook.com')
@@ -22,525 +27,258 @@ SMTP_PORT = getattr(Config, 'SMTP_PORT', 587)
 SMTP_USERNAME = getattr(Config, 'SMTP_USERNAME', '')
 SMTP_PASSWORD = getattr(Config, 'SMTP_PASSWORD', '')
 FROM_EMAIL = getattr(Config, 'FROM_EMAIL', 'noreply@petitionsystem.com')
+SMTP_USE_TLS = getattr(Config, 'SMTP_USE_TLS', True)
+SMTP_POOL_SIZE = getattr(Config, 'SMTP_POOL_SIZE', 3)
+SMTP_POOL_MAX_IDLE = getattr(Config, 'SMTP_POOL_MAX_IDLE', 60)
+SMTP_MAX_MESSAGES_PER_CONNECTION = getattr(Config, 'SMTP_MAX_MESSAGES_PER_CONNECTION', 100)
+EMAIL_WORKERS = getattr(Config, 'EMAIL_WORKERS', SMTP_POOL_SIZE)
+EMAIL_MAX_PER_DOMAIN = getattr(Config, 'EMAIL_MAX_PER_DOMAIN', 2)
+EMAIL_DRAIN_TIMEOUT = getattr(Config, 'EMAIL_DRAIN_TIMEOUT', 30)
+# Turn off in web processes when email workers run separately (python email_utils.py)
+EMAIL_WORKERS_ENABLED = getattr(Config, 'EMAIL_WORKERS_ENABLED', True)
+EMAIL_OUTBOX_POLL_INTERVAL = getattr(Config, 'EMAIL_OUTBOX_POLL_INTERVAL', 1.0)
+# Status changes to one user's petitions within this window go out as a
+# single digest; 0 sends one email per change
+STATUS_DIGEST_WINDOW = timedelta(minutes=getattr(Config, 'STATUS_DIGEST_WINDOW_MINUTES', 5))
+
+# Authenticated SMTP sessions shared by the email workers
+smtp_pool = SMTPConnectionPool(
+    SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+    size=SMTP_POOL_SIZE,
+    use_tls=SMTP_USE_TLS,
+    max_idle=SMTP_POOL_MAX_IDLE,
+    max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION
+)
 
 print(f"📧 Email Configuration:")
 print(f"   SMTP Server: {SMTP_SERVER}:{SMTP_PORT}")
 print(f"   From Email: {FROM_EMAIL}")
 print(f"   SMTP Username: {SMTP_USERNAME}")
-print(f"   Email Worker Thread Started: Active")
+print(f"   SMTP Pool Size: {SMTP_POOL_SIZE}")
+if EMAIL_WORKERS_ENABLED:
+    print(f"   Email Workers: {EMAIL_WORKERS} (max {EMAIL_MAX_PER_DOMAIN} per domain)")
+else:
+    print(f"   Email Workers: disabled in this process (outbox only)")
+
+def render_email(template, context):
+    """HTML for a registered template; UndeliverableEmail if it can't be rendered"""
+    render = EMAIL_TEMPLATES.get(template)
+    if render is None:
+        raise UndeliverableEmail(f"Unknown email template: {template}")
+    try:
+        return render(**context)
+    except Exception as e:
+        raise UndeliverableEmail(f"Could not render {template}: {str(e)}") from e
+
+def deliver_email(message):
+    """Render (if needed), build and send one outbox message; raises if the send failed"""
+    to_email = message['to_email']
+    subject = message['subject']
+    if message.get('template') in EMAIL_SUBJECTS:
+        subject = EMAIL_SUBJECTS[message['template']](**message.get('context', {}))
+    
+    print(f"📤 Processing email to: {to_email} (attempt {message.get('attempts', 1)})")
+    print(f"   Subject: {subject}")
+    
+    try:
+        if message.get('template'):
+            body = render_email(message['template'], message.get('context', {}))
+        else:
+            body = message['body']
+        
+        msg = MIMEMultipart()
+        msg['From'] = FROM_EMAIL
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html'))
+        
+        # Reuses an open, authenticated session when one is available
+        print(f"   Sending message...")
+        smtp_pool.send(msg)
+        
+        print(f"✅ Email sent successfully to {to_email}")
+    except smtplib.SMTPException as smtp_error:
+        print(f"❌ SMTP error sending to {to_email}: {str(smtp_error)}")
+        raise
+    except Exception as e:
+        print(f"❌ Failed to send email to {to_email}: {str(e)}")
+        raise
 
-def send_email_worker():
-    """Background worker that processes email queue"""
-    print(f"🚀 Email worker thread started and waiting for emails...")
-    while True:
-        try:
-            email_data = email_queue.get(timeout=1)
-            if email_data is None:  # Shutdown signal
-                break
-            
-            to_email = email_data['to_email']
-            subject = email_data['subject']
-            body = email_data['body']
-            
-            print(f"📤 Processing email to: {to_email}")
-            print(f"   Subject: {subject}")
-            
-            try:
-                msg = MIMEMultipart()
-                msg['From'] = FROM_EMAIL
-                msg['To'] = to_email
-                msg['Subject'] = subject
-                msg.attach(MIMEText(body, 'html'))
-                
-                # Use timeout to prevent hanging
-                print(f"   Connecting to {SMTP_SERVER}:{SMTP_PORT}...")
-                server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=10)
-                server.starttls()
-                print(f"   Authenticating as {SMTP_USERNAME}...")
-                server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                print(f"   Sending message...")
-                server.send_message(msg)
-                server.quit()
-                
-                print(f"✅ Email sent successfully to {to_email}")
-            except smtplib.SMTPException as smtp_error:
-                print(f"❌ SMTP error sending to {to_email}: {str(smtp_error)}")
-            except Exception as e:
-                print(f"❌ Failed to send email to {to_email}: {str(e)}")
-            finally:
-                email_queue.task_done()
-        except queue.Empty:
-            continue
+# Email workers; each holds at most one pooled SMTP session at a time
+email_dispatcher = EmailDispatcher(
+    db,
+    deliver_email,
+    workers=EMAIL_WORKERS,
+    per_domain_limit=EMAIL_MAX_PER_DOMAIN,
+    poll_interval=EMAIL_OUTBOX_POLL_INTERVAL
+)
+if EMAIL_WORKERS_ENABLED:
+    email_dispatcher.start()
+atexit.register(email_dispatcher.shutdown, EMAIL_DRAIN_TIMEOUT)
 
-# Start email worker thread
-email_worker_thread = threading.Thread(target=send_email_worker, daemon=True)
-email_worker_thread.start()
+def queue_email(to_email, subject, body=None, lane=DEFAULT_LANE, template=None, context=None):
+    """Add email to the outbox for async sending"""
+    if EMAIL_WORKERS_ENABLED:
+        email_dispatcher.start()
+    email_dispatcher.submit(to_email, subject, body, lane, template, context)
+    print(f"📧 Email queued for: {to_email} ({lane})")
 
-def queue_email(to_email, subject, body):
-    """Add email to queue for async sending"""
-    email_queue.put({
-        'to_email': to_email,
-        'subject': subject,
-        'body': body
-    })
-    print(f"📧 Email queued for: {to_email}")
+def queue_emails(messages):
+    """Add many emails to the outbox in one write; items hold queue_email's arguments"""
+    if EMAIL_WORKERS_ENABLED:
+        email_dispatcher.start()
+    message_ids = email_dispatcher.submit_many(messages)
+    print(f"📧 {len(message_ids)} emails queued")
+    return message_ids
 
 def generate_otp():
     """Generate a 6-digit OTP"""
     return str(random.randint(100000, 999999))
 
-def get_otp_email_template(user_name, otp):
-    """
-    Returns a beautiful HTML email template for OTP verification
-    """
-    return f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Verify Your Email</title>
-    </head>
-    <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4;">
-        <table role="presentation" style="width: 100%; border-collapse: collapse;">
-            <tr>
-                <td align="center" style="padding: 40px 0;">
-                    <table role="presentation" style="width: 600px; border-collapse: collapse; background-color: #ffffff; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); border-radius: 8px; overflow: hidden;">
-                        <!-- Header -->
-                        <tr>
-                            <td style="background: linear-gradient(135deg, #4361ee 0%, #7209b7 100%); padding: 40px 30px; text-align: center;">
-                                <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: 600;">
-                                    <span style="font-size: 36px;">🔒</span><br>
-                                    Email Verification
-                                </h1>
-                            </td>
-                        </tr>
-                        
-                        <!-- Content -->
-                        <tr>
-                            <td style="padding: 40px 30px;">
-                                <h2 style="color: #333333; margin: 0 0 20px 0; font-size: 24px;">
-                                    Hello {user_name}! 👋
-                                </h2>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 20px 0;">
-                                    Thank you for registering with the Petition Management System. To complete your registration and start making a difference in your community, please verify your email address.
-                                </p>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 30px 0;">
-                                    Use the following One-Time Password (OTP) to verify your account:
-                                </p>
-                                
-                                <!-- OTP Box -->
-                                <table role="presentation" style="width: 100%; border-collapse: collapse; margin: 0 0 30px 0;">
-                                    <tr>
-                                        <td align="center">
-                                            <div style="background: linear-gradient(135deg, #4361ee 0%, #7209b7 100%); padding: 20px 40px; border-radius: 8px; display: inline-block;">
-                                                <span style="color: #ffffff; font-size: 36px; font-weight: bold; letter-spacing: 8px; font-family: 'Courier New', monospace;">
-                                                    {otp}
-                                                </span>
-                                            </div>
-                                        </td>
-                                    </tr>
-                                </table>
-                                
-                                <div style="background-color: #fff3cd; border-left: 4px solid #ffc107; padding: 15px; margin: 0 0 30px 0; border-radius: 4px;">
-                                    <p style="color: #856404; margin: 0; font-size: 14px;">
-                                        ⚠️ <strong>Important:</strong> This OTP will expire in 10 minutes. Please do not share this code with anyone.
-                                    </p>
-                                </div>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0;">
-                                    If you didn't create an account with us, please ignore this email or contact our support team.
-                                </p>
-                            </td>
-                        </tr>
-                        
-                        <!-- Features Section -->
-                        <tr>
-                            <td style="padding: 0 30px 30px 30px;">
-                                <h3 style="color: #333333; font-size: 18px; margin: 0 0 20px 0;">
-                                    What you can do after verification:
-                                </h3>
-                                <table role="presentation" style="width: 100%; border-collapse: collapse;">
-                                    <tr>
-                                        <td style="padding: 10px 0;">
-                                            <span style="color: #4cc9f0; font-size: 20px; margin-right: 10px;">✓</span>
-                                            <span style="color: #666666; font-size: 14px;">Submit and track petitions</span>
-                                        </td>
-                                    </tr>
-                                    <tr>
-                                        <td style="padding: 10px 0;">
-                                            <span style="color: #4cc9f0; font-size: 20px; margin-right: 10px;">✓</span>
-                                            <span style="color: #666666; font-size: 14px;">Get real-time updates on petition status</span>
-                                        </td>
-                                    </tr>
-                                    <tr>
-                                        <td style="padding: 10px 0;">
-                                            <span style="color: #4cc9f0; font-size: 20px; margin-right: 10px;">✓</span>
-                                            <span style="color: #666666; font-size: 14px;">Connect with local departments</span>
-                                        </td>
-                                    </tr>
-                                    <tr>
-                                        <td style="padding: 10px 0;">
-                                            <span style="color: #4cc9f0; font-size: 20px; margin-right: 10px;">✓</span>
-                                            <span style="color: #666666; font-size: 14px;">Make a difference in your community</span>
-                                        </td>
-                                    </tr>
-                                </table>
-                            </td>
-                        </tr>
-                        
-                        <!-- Footer -->
-                        <tr>
-                            <td style="background-color: #f8f9fa; padding: 30px; text-align: center; border-top: 1px solid #dee2e6;">
-                                <p style="color: #6c757d; font-size: 14px; margin: 0 0 10px 0;">
-                                    <strong>Petition Management System</strong>
-                                </p>
-                                <p style="color: #6c757d; font-size: 12px; margin: 0 0 15px 0;">
-                                    Empowering communities through civic engagement
-                                </p>
-                                <p style="color: #6c757d; font-size: 11px; margin: 15px 0 0 0;">
-                                    © 2025 Petition Management System. All rights reserved.
-                                </p>
-                            </td>
-                        </tr>
-                    </table>
-                </td>
-            </tr>
-        </table>
-    </body>
-    </html>
-    """
+def send_email(to_email, subject, html_body, lane=DEFAULT_LANE):
+    """Queue email for async sending (non-blocking).
 
-def get_welcome_email_template(user_name):
+    `lane` is 'transactional' for mail answering a user's own action (OTPs,
+    confirmations), 'alert' for department alerts and 'bulk' for reports.
     """
-    Returns a welcome email template after successful verification
+    queue_email(to_email, subject, html_body, lane)
+    return True  # Return immediately, email will be sent in background
+
+def send_templated_email(to_email, subject, template, context, lane=DEFAULT_LANE):
+    """Queue a registered template and its data; the email worker renders it (non-blocking)"""
+    if template not in EMAIL_TEMPLATES:
+        raise ValueError(f"Unknown email template: {template}")
+    queue_email(to_email, subject, lane=lane, template=template, context=context)
+    return True
+
+def send_templated_emails(messages, lane=DEFAULT_LANE):
+    """Queue a batch of templated emails in one outbox write (non-blocking).
+
+    Each item has `to_email`, `subject`, `template` and `context`.
     """
-    return f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Welcome!</title>
-    </head>
-    <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4;">
-        <table role="presentation" style="width: 100%; border-collapse: collapse;">
-            <tr>
-                <td align="center" style="padding: 40px 0;">
-                    <table role="presentation" style="width: 600px; border-collapse: collapse; background-color: #ffffff; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); border-radius: 8px; overflow: hidden;">
-                        <!-- Header -->
-                        <tr>
-                            <td style="background: linear-gradient(135deg, #4361ee 0%, #7209b7 100%); padding: 40px 30px; text-align: center;">
-                                <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: 600;">
-                                    <span style="font-size: 36px;">🎉</span><br>
-                                    Welcome to Our Community!
-                                </h1>
-                            </td>
-                        </tr>
-                        
-                        <!-- Content -->
-                        <tr>
-                            <td style="padding: 40px 30px;">
-                                <h2 style="color: #333333; margin: 0 0 20px 0; font-size: 24px;">
-                                    Congratulations {user_name}! 🎊
-                                </h2>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 20px 0;">
-                                    Your email has been successfully verified! You're now part of a community that's making real change happen.
-                                </p>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 30px 0;">
-                                    Ready to get started? Here's what you can do now:
-                                </p>
-                                
-                                <div style="background-color: #e7f3ff; padding: 20px; border-radius: 8px; margin: 0 0 30px 0;">
-                                    <p style="color: #004085; margin: 0; font-size: 14px; line-height: 1.6;">
-                                        💡 <strong>Pro Tip:</strong> Start by exploring active petitions in your area or submit your first petition to address issues that matter to you!
-                                    </p>
-                                </div>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 20px 0;">
-                                    We're excited to have you on board!
-                                </p>
-                            </td>
-                        </tr>
-                        
-                        <!-- Footer -->
-                        <tr>
-                            <td style="background-color: #f8f9fa; padding: 30px; text-align: center; border-top: 1px solid #dee2e6;">
-                                <p style="color: #6c757d; font-size: 14px; margin: 0 0 10px 0;">
-                                    <strong>Petition Management System</strong>
-                                </p>
-                                <p style="color: #6c757d; font-size: 12px; margin: 0;">
-                                    © 2025 Petition Management System. All rights reserved.
-                                </p>
-                            </td>
-                        </tr>
-                    </table>
-                </td>
-            </tr>
-        </table>
-    </body>
-    </html>
+    for message in messages:
+        if message['template'] not in EMAIL_TEMPLATES:
+            raise ValueError(f"Unknown email template: {message['template']}")
+    return len(queue_emails([{**message, 'lane': lane} for message in messages]))
+
+def send_digest_email(to_email, template, key, item, window, context=None, lane=DEFAULT_LANE):
+    """Add `item` to the recipient's open `key` digest, sent `window` after its first item (non-blocking).
+
+    The template gets `context` plus the collected `items`; its subject
+    comes from EMAIL_SUBJECTS when the digest is sent.
     """
+    if template not in EMAIL_SUBJECTS:
+        raise ValueError(f"No digest subject for email template: {template}")
+    if EMAIL_WORKERS_ENABLED:
+        email_dispatcher.start()
+    subject = EMAIL_SUBJECTS[template](**(context or {}), items=[item])
+    coalesce_email(db, to_email, subject, template, key, item, window, context=context, lane=lane)
+    print(f"📧 Email added to {key} digest for: {to_email}")
+    return True
 
-def send_email(to_email, subject, html_body):
-    """Queue email for async sending (non-blocking)"""
-    queue_email(to_email, subject, html_body)
-    return True  # Return immediately, email will be sent in background
+def pick_fields(document, fields):
+    """The given fields of a document, for a small template context"""
+    return {field: document[field] for field in fields if field in document}
 
 def send_otp_email(to_email, otp, user_name):
     """Send OTP email to user (async)"""
     subject = "🔒 Verify Your Email - Petition Management System"
-    html_body = get_otp_email_template(user_name, otp)
-    return send_email(to_email, subject, html_body)
+    return send_templated_email(to_email, subject, 'otp', {'user_name': user_name, 'otp': otp},
+                                lane='transactional')
 
 def send_welcome_email(to_email, user_name):
     """Send welcome email after successful verification (async)"""
     subject = "🎉 Welcome to Petition Management System!"
-    html_body = get_welcome_email_template(user_name)
-    return send_email(to_email, subject, html_body)
+    return send_templated_email(to_email, subject, 'welcome', {'user_name': user_name}, lane='transactional')
 
 def get_otp_expiry():
     """Get OTP expiry time (10 minutes from now)"""
     return datetime.now(UTC) + timedelta(minutes=10)
 
-def get_petition_submission_email_template(user_name, ticket_id, title):
-    """
-    Returns HTML email template for petition submission confirmation
-    """
-    current_time = datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
-    return f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Petition Submitted</title>
-    </head>
-    <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4;">
-        <table role="presentation" style="width: 100%; border-collapse: collapse;">
-            <tr>
-                <td align="center" style="padding: 40px 0;">
-                    <table role="presentation" style="width: 600px; border-collapse: collapse; background-color: #ffffff; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); border-radius: 8px; overflow: hidden;">
-                        <!-- Header -->
-                        <tr>
-                            <td style="background: linear-gradient(135deg, #4361ee 0%, #7209b7 100%); padding: 40px 30px; text-align: center;">
-                                <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: 600;">
-                                    <span style="font-size: 36px;">📝</span><br>
-                                    Petition Submitted Successfully
-                                </h1>
-                            </td>
-                        </tr>
-                        
-                        <!-- Content -->
-                        <tr>
-                            <td style="padding: 40px 30px;">
-                                <h2 style="color: #333333; margin: 0 0 20px 0; font-size: 24px;">
-                                    Dear {user_name},
-                                </h2>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 30px 0;">
-                                    Your petition has been submitted successfully and is now being reviewed by the concerned department.
-                                </p>
-                                
-                                <!-- Petition Details Box -->
-                                <div style="background: linear-gradient(135deg, #e7f3ff 0%, #f0e7ff 100%); padding: 25px; border-radius: 8px; margin: 0 0 30px 0; border-left: 4px solid #4361ee;">
-                                    <p style="color: #333333; margin: 0 0 12px 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Petition Title:</strong><br>
-                                        <span style="font-size: 16px; color: #212529;">{title}</span>
-                                    </p>
-                                    <p style="color: #333333; margin: 0 0 12px 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Ticket ID:</strong><br>
-                                        <span style="font-size: 18px; color: #212529; font-weight: 600; font-family: 'Courier New', monospace;">{ticket_id}</span>
-                                    </p>
-                                    <p style="color: #333333; margin: 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Submission Date:</strong><br>
-                                        <span style="color: #212529;">{current_time}</span>
-                                    </p>
-                                </div>
-                                
-                                <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 0 0 30px 0; border-left: 4px solid #f8961e;">
-                                    <p style="color: #856404; margin: 0; font-size: 14px; line-height: 1.6;">
-                                        📌 <strong>Important:</strong> Save your Ticket ID ({ticket_id}) to track your petition status at any time.
-                                    </p>
-                                </div>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 20px 0;">
-                                    You will receive email notifications whenever your petition status is updated.
-                                </p>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0;">
-                                    Thank you for using the Petition Management System!
-                                </p>
-                            </td>
-                        </tr>
-                        
-                        <!-- Footer -->
-                        <tr>
-                            <td style="background-color: #f8f9fa; padding: 30px; text-align: center; border-top: 1px solid #dee2e6;">
-                                <p style="color: #6c757d; font-size: 14px; margin: 0 0 10px 0;">
-                                    <strong>Petition Management System</strong>
-                                </p>
-                                <p style="color: #6c757d; font-size: 12px; margin: 0;">
-                                    © 2025 Petition Management System. All rights reserved.
-                                </p>
-                            </td>
-                        </tr>
-                    </table>
-                </td>
-            </tr>
-        </table>
-    </body>
-    </html>
-    """
-
-def get_petition_status_update_email_template(user_name, ticket_id, title, old_status, new_status):
-    """
-    Returns HTML email template for petition status update notification
-    """
-    current_time = datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
-    
-    status_info = {
-        'pending': {
-            'label': 'Pending Review',
-            'color': '#f8961e',
-            'bg_color': '#fff3cd',
-            'icon': '⏳'
-        },
-        'in_progress': {
-            'label': 'In Progress',
-            'color': '#0096c7',
-            'bg_color': '#d1ecf1',
-            'icon': '🔄'
-        },
-        'resolved': {
-            'label': 'Resolved',
-            'color': '#059669',
-            'bg_color': '#d4edda',
-            'icon': '✅'
-        },
-        'rejected': {
-            'label': 'Rejected',
-            'color': '#f72585',
-            'bg_color': '#f8d7da',
-            'icon': '❌'
-        }
-    }
-    
-    old_info = status_info.get(old_status, {'label': old_status, 'color': '#6c757d', 'bg_color': '#e2e3e5', 'icon': '📋'})
-    new_info = status_info.get(new_status, {'label': new_status, 'color': '#6c757d', 'bg_color': '#e2e3e5', 'icon': '📋'})
-    
-    return f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Petition Status Updated</title>
-    </head>
-    <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4;">
-        <table role="presentation" style="width: 100%; border-collapse: collapse;">
-            <tr>
-                <td align="center" style="padding: 40px 0;">
-                    <table role="presentation" style="width: 600px; border-collapse: collapse; background-color: #ffffff; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); border-radius: 8px; overflow: hidden;">
-                        <!-- Header -->
-                        <tr>
-                            <td style="background: linear-gradient(135deg, #4361ee 0%, #7209b7 100%); padding: 40px 30px; text-align: center;">
-                                <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: 600;">
-                                    <span style="font-size: 36px;">🔔</span><br>
-                                    Petition Status Updated
-                                </h1>
-                            </td>
-                        </tr>
-                        
-                        <!-- Content -->
-                        <tr>
-                            <td style="padding: 40px 30px;">
-                                <h2 style="color: #333333; margin: 0 0 20px 0; font-size: 24px;">
-                                    Dear {user_name},
-                                </h2>
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 30px 0;">
-                                    Great news! The status of your petition has been updated by the department.
-                                </p>
-                                
-                                <!-- Petition Details Box -->
-                                <div style="background: linear-gradient(135deg, #e7f3ff 0%, #f0e7ff 100%); padding: 25px; border-radius: 8px; margin: 0 0 30px 0; border-left: 4px solid #4361ee;">
-                                    <p style="color: #333333; margin: 0 0 12px 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Petition Title:</strong><br>
-                                        <span style="font-size: 16px; color: #212529;">{title}</span>
-                                    </p>
-                                    <p style="color: #333333; margin: 0 0 12px 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Ticket ID:</strong><br>
-                                        <span style="font-size: 18px; color: #212529; font-weight: 600; font-family: 'Courier New', monospace;">{ticket_id}</span>
-                                    </p>
-                                    <p style="color: #333333; margin: 0; font-size: 14px;">
-                                        <strong style="color: #4361ee;">Update Date:</strong><br>
-                                        <span style="color: #212529;">{current_time}</span>
-                                    </p>
-                                </div>
-                                
-                                <!-- Status Change Box -->
-                                <div style="background-color: #f8f9fa; padding: 25px; border-radius: 8px; margin: 0 0 30px 0;">
-                                    <table role="presentation" style="width: 100%; border-collapse: collapse;">
-                                        <tr>
-                                            <td style="width: 45%; text-align: center; padding: 15px;">
-                                                <div style="background-color: {old_info['bg_color']}; padding: 15px; border-radius: 6px; border: 2px solid {old_info['color']};">
-                                                    <p style="margin: 0; font-size: 12px; color: #666666;">Previous Status</p>
-                                                    <p style="margin: 10px 0 0 0; font-size: 20px; color: {old_info['color']}; font-weight: 600;">
-                                                        {old_info['icon']} {old_info['label']}
-                                                    </p>
-                                                </div>
-                                            </td>
-                                            <td style="width: 10%; text-align: center; font-size: 24px; color: #4361ee;">
-                                                →
-                                            </td>
-                                            <td style="width: 45%; text-align: center; padding: 15px;">
-                                                <div style="background-color: {new_info['bg_color']}; padding: 15px; border-radius: 6px; border: 2px solid {new_info['color']};">
-                                                    <p style="margin: 0; font-size: 12px; color: #666666;">New Status</p>
-                                                    <p style="margin: 10px 0 0 0; font-size: 20px; color: {new_info['color']}; font-weight: 600;">
-                                                        {new_info['icon']} {new_info['label']}
-                                                    </p>
-                                                </div>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </div>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0 0 20px 0;">
-                                    You can track your petition anytime using your Ticket ID on our website.
-                                </p>
-                                
-                                <p style="color: #666666; font-size: 16px; line-height: 1.6; margin: 0;">
-                                    Thank you for using the Petition Management System!
-                                </p>
-                            </td>
-                        </tr>
-                        
-                        <!-- Footer -->
-                        <tr>
-                            <td style="background-color: #f8f9fa; padding: 30px; text-align: center; border-top: 1px solid #dee2e6;">
-                                <p style="color: #6c757d; font-size: 14px; margin: 0 0 10px 0;">
-                                    <strong>Petition Management System</strong>
-                                </p>
-                                <p style="color: #6c757d; font-size: 12px; margin: 0;">
-                                    © 2025 Petition Management System. All rights reserved.
-                                </p>
-                            </td>
-                        </tr>
-                    </table>
-                </td>
-            </tr>
-        </table>
-    </body>
-    </html>
-    """
-
 def send_petition_submission_email(user_email, user_name, ticket_id, title):
     """Send petition submission confirmation email (async)"""
     subject = f"📝 Petition Submitted Successfully - Ticket ID: {ticket_id}"
-    html_body = get_petition_submission_email_template(user_name, ticket_id, title)
-    return send_email(user_email, subject, html_body)
+    context = {'user_name': user_name, 'ticket_id': ticket_id, 'title': title}
+    return send_templated_email(user_email, subject, 'petition_submission', context, lane='transactional')
 
 def send_petition_status_update_email(user_email, user_name, ticket_id, title, old_status, new_status):
-    """Send petition status update notification email (async)"""
+    """Send petition status update notification email (async).
+
+    Changes are collected per user for STATUS_DIGEST_WINDOW and sent as one
+    digest, so a petition moved through several statuses, or a batch of a
+    user's petitions updated together, costs one email. Nothing is sent
+    when the status did not change.
+    """
+    if old_status == new_status:
+        return False
+    if STATUS_DIGEST_WINDOW:
+        item = {
+            'ticket_id': ticket_id,
+            'title': title,
+            'old_status': old_status,
+            'new_status': new_status,
+            'updated_at': datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
+        }
+        return send_digest_email(user_email, 'status_digest', 'status_update', item, STATUS_DIGEST_WINDOW,
+                                 context={'user_name': user_name}, lane='transactional')
+
     subject = f"🔔 Petition Status Updated - Ticket ID: {ticket_id}"
-    html_body = get_petition_status_update_email_template(user_name, ticket_id, title, old_status, new_status)
-    return send_email(user_email, subject, html_body)
+    context = {
+        'user_name': user_name,
+        'ticket_id': ticket_id,
+        'title': title,
+        'old_status': old_status,
+        'new_status': new_status
+    }
+    return send_templated_email(user_email, subject, 'petition_status_update', context, lane='transactional')
+
+
+# Templates the email workers render, by the name stored in the outbox
+EMAIL_TEMPLATES = {
+    'otp': get_otp_email_template,
+    'welcome': get_welcome_email_template,
+    'petition_submission': get_petition_submission_email_template,
+    'petition_status_update': get_petition_status_update_email_template,
+    'high_urgency_alert': email_templates.get_high_urgency_alert_template,
+    'daily_summary': email_templates.get_daily_summary_template,
+    'weekly_report': email_templates.get_weekly_report_template,
+    'deadline_reminder': email_templates.get_deadline_reminder_template,
+    'rejection': email_templates.get_rejection_email_template,
+    'status_digest': email_templates.get_status_digest_template,
+    'deadline_digest': email_templates.get_deadline_digest_template
+}
+
+def status_digest_subject(user_name, items):
+    ticket_ids = {item['ticket_id'] for item in items}
+    if len(ticket_ids) == 1:
+        return f"🔔 Petition Status Updated - Ticket ID: {items[0]['ticket_id']}"
+    return f"🔔 {len(ticket_ids)} Petitions Updated"
+
+def deadline_digest_subject(department_name, items, escalation=False):
+    ticket_ids = {item['petition_data'].get('ticket_id') for item in items}
+    if escalation:
+        if len(ticket_ids) == 1:
+            return f"🚨 Overdue Petition Escalation: {items[0]['petition_data'].get('ticket_id')}"
+        return f"🚨 Overdue Petition Escalation: {len(ticket_ids)} petitions - {department_name}"
+    if len(ticket_ids) == 1:
+        return f"⚠️ Deadline Reminder: Petition {items[0]['petition_data'].get('ticket_id')}"
+    return f"⚠️ Deadline Reminder: {len(ticket_ids)} petitions due soon - {department_name}"
+
+# Subjects of templates whose content is collected in the outbox, built at
+# send time from the same context as the body
+EMAIL_SUBJECTS = {
+    'status_digest': status_digest_subject,
+    'deadline_digest': deadline_digest_subject
+}
+
+
+if __name__ == '__main__':
+    # Standalone email worker: sends everything the web processes put in the outbox
+    import time
+    email_dispatcher.start()
+    print(f"🚀 Email worker running ({EMAIL_WORKERS} threads); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,257 @@
+"""
+Declarative index registry and startup index migrations
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from notifications import NOTIFICATION_RETENTION, EVENT_RETENTION
+from email_outbox import EMAIL_OUTBOX_RETENTION
+
+
+class IndexSpec:
+    """One index declared for a collection.
+
+    `replaces` names an index this one supersedes; it is dropped once this
+    one exists.
+    """
+
+    def __init__(self, collection, keys, name, unique=False, reason='', replaces=None, **options):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.unique = unique
+        self.reason = reason
+        self.replaces = replaces
+        self.options = options
+
+    def key_document(self):
+        return [(field, direction) for field, direction in self.keys]
+
+    def stored_keys(self):
+        """Keys as index_information() reports them.
+
+        MongoDB stores the fields of a text index as weights, keyed by the
+        placeholder fields `_fts`/`_ftsx`.
+        """
+        keys = []
+        for field, direction in self.keys:
+            if direction == TEXT:
+                if ('_fts', TEXT) not in keys:
+                    keys.extend([('_fts', TEXT), ('_ftsx', 1)])
+            else:
+                keys.append((field, direction))
+        return keys
+
+    def create_kwargs(self):
+        kwargs = {'name': self.name}
+        if self.unique:
+            kwargs['unique'] = True
+        kwargs.update(self.options)
+        return kwargs
+
+
+# Every query shape the application relies on, with the route that needs it
+INDEX_REGISTRY = [
+    IndexSpec('users', [('email', ASCENDING)], 'users_email_unique', unique=True,
+              reason='login, registration and OTP lookups'),
+    IndexSpec('admins', [('email', ASCENDING)], 'admins_email_unique', unique=True,
+              reason='admin login'),
+    IndexSpec('departments', [('email', ASCENDING)], 'departments_email_unique', unique=True,
+              reason='department login'),
+    IndexSpec('departments', [('name', ASCENDING)], 'departments_name',
+              reason='department lookup by name for alerts and reports'),
+    IndexSpec('petitions', [('ticket_id', ASCENDING)], 'petitions_ticket_id_unique', unique=True,
+              reason='tracking, status updates and deadline routes'),
+    IndexSpec('petitions', [('department', ASCENDING), ('status', ASCENDING)], 'petitions_department_status',
+              reason='department statistics and status filters'),
+    IndexSpec('petitions', [('created_at', DESCENDING), ('_id', DESCENDING)], 'petitions_created_at_id',
+              reason='admin petition list keyset pagination'),
+    IndexSpec('petitions', [('department', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+              'petitions_department_created_at_id',
+              reason='department petition lists, analytics and reports'),
+    IndexSpec('petitions', [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+              'petitions_user_created_at_id',
+              reason='user petition history and dashboard'),
+    IndexSpec('petitions', [('status', ASCENDING), ('deadline', ASCENDING), ('_id', ASCENDING)],
+              'petitions_status_deadline_id', replaces='petitions_status_deadline',
+              reason='overdue petitions and deadline reminders'),
+    IndexSpec('petitions',
+              [('department', ASCENDING), ('status', ASCENDING), ('deadline', ASCENDING), ('_id', ASCENDING)],
+              'petitions_department_status_deadline_id', replaces='petitions_department_status_deadline',
+              reason='per-department overdue petitions'),
+    IndexSpec('petitions', [('status', ASCENDING), ('updated_at', DESCENDING)], 'petitions_status_updated_at',
+              reason='daily reports: petitions resolved in the last day'),
+    IndexSpec('petitions', [('urgency', ASCENDING), ('status', ASCENDING)], 'petitions_urgency_status',
+              reason='daily reports: open high-urgency petitions'),
+    IndexSpec('petitions', [('title', TEXT), ('description', TEXT)], 'petitions_text',
+              weights={'title': 10, 'description': 3}, default_language='english',
+              reason='ranked search in assigned petitions'),
+    IndexSpec('petition_counters', [('department', ASCENDING), ('status', ASCENDING)],
+              'petition_counters_department_status_unique', unique=True,
+              reason='department dashboard counts'),
+    IndexSpec('notifications',
+              [('department', ASCENDING), ('read', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)],
+              'notifications_department_read_timestamp_id',
+              replaces='notifications_department_read_timestamp',
+              reason='notification lists, unread counts and mark-all-read'),
+    # Changing NOTIFICATION_RETENTION_DAYS later needs a collMod on this index.
+    # Only read notifications expire, so expiry never changes an unread counter.
+    IndexSpec('notifications', [('timestamp', ASCENDING)], 'notifications_read_timestamp_ttl',
+              expireAfterSeconds=int(NOTIFICATION_RETENTION.total_seconds()),
+              partialFilterExpression={'read': True},
+              reason='notification retention'),
+    IndexSpec('notification_events', [('department', ASCENDING), ('_id', ASCENDING)],
+              'notification_events_department_id',
+              reason='Last-Event-ID replay on the notification stream'),
+    IndexSpec('notification_events', [('timestamp', ASCENDING)], 'notification_events_timestamp_ttl',
+              expireAfterSeconds=int(EVENT_RETENTION.total_seconds()),
+              reason='notification event retention'),
+    IndexSpec('email_outbox', [('lane', ASCENDING), ('status', ASCENDING), ('available_at', ASCENDING)],
+              'email_outbox_lane_status_available_at',
+              reason='email workers claiming due messages per priority lane'),
+    IndexSpec('email_outbox', [('to_email', ASCENDING), ('coalesce_key', ASCENDING)],
+              'email_outbox_open_digest_unique', unique=True,
+              partialFilterExpression={'coalescing': True},
+              reason='one open digest per recipient, joined by status updates'),
+    # Only sent messages have sent_at, so pending and dead letters never expire
+    IndexSpec('email_outbox', [('sent_at', ASCENDING)], 'email_outbox_sent_at_ttl',
+              expireAfterSeconds=int(EMAIL_OUTBOX_RETENTION.total_seconds()),
+              reason='sent email retention'),
+]
+
+
+def _existing_indexes(collection):
+    """Map of index name to key list for a collection"""
+    try:
+        info = collection.index_information()
+    except OperationFailure:
+        # Collection does not exist yet
+        return {}
+    return {name: [(field, direction) for field, direction in spec['key']] for name, spec in info.items()}
+
+
+def _normalize_keys(keys):
+    # index_information() reports directions as floats; text indexes use strings
+    return [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in keys]
+
+
+def _find_match(spec, existing):
+    """Name of an existing index covering the same keys as `spec`, if any"""
+    wanted = _normalize_keys(spec.stored_keys())
+    for name, keys in existing.items():
+        if _normalize_keys(keys) == wanted:
+            return name
+    return None
+
+
+def ensure_indexes(db, registry=None, verbose=True):
+    """Create any declared index that is missing.
+
+    Indexes are built one at a time so only a single build competes with live
+    traffic, and an index that already exists under the same keys (whatever
+    its name) is left alone, so running this on every startup is safe.
+    A superseded index is only dropped after its replacement exists.
+    Returns the names of the indexes that were created.
+    """
+    registry = registry or INDEX_REGISTRY
+    created = []
+    for spec in registry:
+        collection = db[spec.collection]
+        existing = _existing_indexes(collection)
+        match = _find_match(spec, existing)
+        if not match:
+            try:
+                collection.create_index(spec.key_document(), **spec.create_kwargs())
+                created.append(f"{spec.collection}.{spec.name}")
+                if verbose:
+                    print(f"🗂️ Created index {spec.collection}.{spec.name}")
+            except OperationFailure as e:
+                print(f"❌ Failed to create index {spec.collection}.{spec.name}: {str(e)}")
+                continue
+        if spec.replaces in existing and spec.replaces != match:
+            try:
+                collection.drop_index(spec.replaces)
+                if verbose:
+                    print(f"🗂️ Dropped superseded index {spec.collection}.{spec.replaces}")
+            except OperationFailure as e:
+                print(f"❌ Failed to drop index {spec.collection}.{spec.replaces}: {str(e)}")
+    return created
+
+
+def index_report(db, registry=None):
+    """Report declared indexes that are missing and existing ones that are unused.
+
+    Usage counts come from `$indexStats`, which resets when mongod restarts,
+    so an index is only reported unused if it has served no operations since.
+    """
+    registry = registry or INDEX_REGISTRY
+    collections = sorted({spec.collection for spec in registry})
+    report = {'missing': [], 'unused': [], 'undeclared': [], 'indexes': []}
+
+    for collection_name in collections:
+        collection = db[collection_name]
+        existing = _existing_indexes(collection)
+        declared = set()
+
+        for spec in registry:
+            if spec.collection != collection_name:
+                continue
+            match = _find_match(spec, existing)
+            if match:
+                declared.add(match)
+            else:
+                report['missing'].append({
+                    'collection': collection_name,
+                    'name': spec.name,
+                    'keys': spec.keys,
+                    'reason': spec.reason
+                })
+
+        try:
+            usage = {stat['name']: stat['accesses']['ops'] for stat in collection.aggregate([{'$indexStats': {}}])}
+        except OperationFailure:
+            usage = {}
+
+        for name in existing:
+            ops = usage.get(name)
+            report['indexes'].append({'collection': collection_name, 'name': name, 'ops': ops})
+            if name == '_id_':
+                continue
+            if name not in declared:
+                report['undeclared'].append({'collection': collection_name, 'name': name, 'ops': ops})
+            if ops == 0:
+                report['unused'].append({'collection': collection_name, 'name': name})
+
+    return report
+
+
+def print_index_report(report):
+    print("🗂️ Index report")
+    for item in report['indexes']:
+        ops = 'n/a' if item['ops'] is None else item['ops']
+        print(f"   {item['collection']}.{item['name']}: {ops} ops")
+    if report['missing']:
+        print("⚠️ Missing indexes:")
+        for item in report['missing']:
+            print(f"   {item['collection']}.{item['name']} {item['keys']} ({item['reason']})")
+    if report['unused']:
+        print("⚠️ Unused indexes:")
+        for item in report['unused']:
+            print(f"   {item['collection']}.{item['name']}")
+    if report['undeclared']:
+        print("ℹ️ Indexes not declared in the registry:")
+        for item in report['undeclared']:
+            print(f"   {item['collection']}.{item['name']}")
+    if not report['missing'] and not report['unused']:
+        print("✅ All declared indexes exist and are in use")
+
+
+if __name__ == '__main__':
+    import sys
+    from database import get_db
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'report':
+        print_index_report(index_report(get_db()))
+    else:
+        created = ensure_indexes(get_db())
+        print(f"✅ Index migration complete ({len(created)} created)")
@@ -1,6 +1,7 @@
 from pymongo import MongoClient
 import bcrypt
 from datetime import datetime, UTC
+from indexes import ensure_indexes
 
 # Connect to MongoDB
 client = MongoClient('mongodb://localhost:27017/')
@@ -13,10 +14,7 @@ db.create_collection('departments')
 db.create_collection('admins')
 
 # Create indexes
-db.users.create_index('email', unique=True)
-db.departments.create_index('email', unique=True)
-db.admins.create_index('email', unique=True)
-db.petitions.create_index('ticket_id', unique=True)
+ensure_indexes(db)
 
 # Create sample admin user
 admin_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -1,11 +1,101 @@
-from pymongo import MongoClient
 from datetime import datetime, UTC
+import base64
+import json
 import bcrypt
-from config import Config
 from bson import ObjectId
+from bson.errors import InvalidId
+from database import db
+from counters import increment_status, move_status
 
-client = MongoClient(Config.MONGO_URI)
-db = client.petition_system
+# Largest page a petition list route will return
+MAX_PAGE_SIZE = 200
+
+# Newest first, with _id breaking ties between petitions created in the same instant
+PETITION_SORT = [('created_at', -1), ('_id', -1)]
+
+# Statuses that still count against a petition's deadline
+OPEN_STATUSES = ['pending', 'in_progress']
+
+# Most overdue first
+OVERDUE_SORT = [('deadline', 1), ('_id', 1)]
+
+# Fields a petition list route may project with `fields=`
+PETITION_FIELDS = (
+    'ticket_id', 'user_id', 'title', 'category', 'department', 'description', 'location',
+    'urgency', 'full_name', 'email', 'phone', 'address', 'attachments', 'status',
+    'rejection_reason', 'created_at', 'updated_at', 'deadline'
+)
+
+# Named projections; None means the whole document
+PETITION_PROJECTIONS = {
+    'summary': ('ticket_id', 'title', 'category', 'department', 'urgency', 'status', 'deadline',
+                'created_at', 'updated_at'),
+    'detail': None
+}
+
+# Always returned so rows stay identifiable and pageable
+PETITION_KEY_FIELDS = ('ticket_id', 'created_at')
+
+def resolve_projection(fields):
+    """Mongo projection for a `fields` value: a named projection or a comma-separated list.
+
+    Returns None (whole document) when `fields` is empty. Raises ValueError for
+    unknown names.
+    """
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        if fields in PETITION_PROJECTIONS:
+            selected = PETITION_PROJECTIONS[fields]
+            if selected is None:
+                return None
+        else:
+            selected = [field.strip() for field in fields.split(',') if field.strip()]
+    else:
+        selected = list(fields)
+    
+    unknown = [field for field in selected if field not in PETITION_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    projection = {field: 1 for field in PETITION_KEY_FIELDS}
+    projection.update({field: 1 for field in selected})
+    return projection
+
+def encode_cursor(petition, field='created_at'):
+    """Opaque cursor pointing just past `petition` when sorted on `field` then _id"""
+    value = petition.get(field)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({'c': value, 'i': str(petition['_id'])}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Return (sort value, _id) from a cursor token, or raise ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload['c']), ObjectId(payload['i'])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError('Invalid cursor') from e
+
+def apply_cursor(query, cursor, field='created_at', direction=-1):
+    """Restrict `query` to petitions after `cursor` when sorted on `field` then _id"""
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    op = '$lt' if direction < 0 else '$gt'
+    after = {'$or': [
+        {field: {op: value}},
+        {field: value, '_id': {op: last_id}}
+    ]}
+    return {'$and': [query, after]} if query else after
+
+def next_cursor(petitions, limit, field='created_at'):
+    """Cursor for the page after `petitions`, or None if this was the last page"""
+    if not limit or len(petitions) < limit:
+        return None
+    return encode_cursor(petitions[-1], field)
 
 class User:
     def __init__(self, name, email, phone, address, password):
@@ -167,7 +257,7 @@ class Petition:
     
     def save(self):
         # Always store user_id as string
-        return db.petitions.insert_one({
+        result = db.petitions.insert_one({
             'user_id': str(self.user_id),
             'title': self.title,
             'category': self.category,
@@ -187,20 +277,31 @@ class Petition:
             'updated_at': self.updated_at,
             'deadline': self.deadline
         })
+        increment_status(db, self.department, self.status)
+        return result
     
     @staticmethod
-    def find_by_user(user_id):
+    def _find_page(query, limit=None, cursor=None, projection=None):
+        """Petitions matching `query`, newest first, optionally one keyset page"""
+        results = db.petitions.find(apply_cursor(query, cursor), projection).sort(PETITION_SORT)
+        if limit:
+            results = results.limit(limit)
+        petitions = list(results)
+        
+        # Convert ObjectId to string for JSON serialization
+        for petition in petitions:
+            if '_id' in petition:
+                petition['_id'] = str(petition['_id'])
+            if 'user_id' in petition:
+                petition['user_id'] = str(petition['user_id'])
+        
+        return petitions
+    
+    @staticmethod
+    def find_by_user(user_id, limit=None, cursor=None, projection=None):
         try:
             # Always query user_id as string
-            query = {'user_id': str(user_id)}
-            cursor = db.petitions.find(query).sort('created_at', -1)
-            petitions = list(cursor)
-            
-            # Convert ObjectId to string for JSON serialization
-            for petition in petitions:
-                petition['_id'] = str(petition['_id'])
-            
-            return petitions
+            return Petition._find_page({'user_id': str(user_id)}, limit, cursor, projection)
         except Exception as e:
             print(f'Error in find_by_user: {str(e)}')
             print(f'User ID: {user_id}')
@@ -222,42 +323,86 @@ class Petition:
             return None
     
     @staticmethod
-    def find_all():
+    def find_all(limit=None, cursor=None, projection=None):
         try:
-            petitions = list(db.petitions.find().sort('created_at', -1))
-            
-            # Convert ObjectId to string for JSON serialization
-            for petition in petitions:
-                if '_id' in petition:
-                    petition['_id'] = str(petition['_id'])
-                if 'user_id' in petition:
-                    petition['user_id'] = str(petition['user_id'])
-            
-            return petitions
+            return Petition._find_page({}, limit, cursor, projection)
         except Exception as e:
             print(f'Error in find_all: {str(e)}')
             return []
     
     @staticmethod
-    def find_by_department(department):
+    def find_by_department(department, limit=None, cursor=None, projection=None):
         try:
-            petitions = list(db.petitions.find({'department': department}).sort('created_at', -1))
-            
-            # Convert ObjectId to string for JSON serialization
-            for petition in petitions:
-                if '_id' in petition:
-                    petition['_id'] = str(petition['_id'])
-                if 'user_id' in petition:
-                    petition['user_id'] = str(petition['user_id'])
-            
-            return petitions
+            return Petition._find_page({'department': department}, limit, cursor, projection)
         except Exception as e:
             print(f'Error in find_by_department: {str(e)}')
             return []
     
+    @staticmethod
+    def overdue_query(now, department=None):
+        """Open petitions whose deadline has passed (served by the status+deadline index)"""
+        query = {'status': {'$in': OPEN_STATUSES}, 'deadline': {'$lt': now}}
+        if department:
+            query['department'] = department
+        return query
+    
+    @staticmethod
+    def claim_due_reminders(now, hours, reminded_before, projection=None):
+        """Mark and return the open petitions due in the next `hours` hours
+        that haven't been reminded about since `reminded_before`.
+
+        Petitions are claimed with `last_reminded_at` before they are read,
+        so overlapping reminder runs never remind about the same petition.
+        Returned soonest deadline first.
+        """
+        from datetime import timedelta
+        run = ObjectId()
+        due = {
+            'status': {'$in': OPEN_STATUSES},
+            'deadline': {'$gt': now, '$lt': now + timedelta(hours=hours)}
+        }
+        db.petitions.update_many(
+            {**due, 'last_reminded_at': {'$not': {'$gte': reminded_before}}},
+            {'$set': {'last_reminded_at': now, 'reminder_run': run}}
+        )
+        # Read back through the same status+deadline range
+        return list(db.petitions.find({**due, 'reminder_run': run}, projection).sort(OVERDUE_SORT))
+    
+    @staticmethod
+    def count_overdue(now, department=None):
+        return db.petitions.count_documents(Petition.overdue_query(now, department))
+    
+    @staticmethod
+    def find_overdue(now, department=None, limit=None, cursor=None):
+        """Overdue petitions, most overdue first, optionally one keyset page"""
+        query = apply_cursor(Petition.overdue_query(now, department), cursor, 'deadline', 1)
+        results = db.petitions.find(query).sort(OVERDUE_SORT)
+        if limit:
+            results = results.limit(limit)
+        petitions = list(results)
+        
+        for petition in petitions:
+            petition['_id'] = str(petition['_id'])
+            if 'user_id' in petition:
+                petition['user_id'] = str(petition['user_id'])
+        
+        return petitions
+    
     @staticmethod
     def update_status(ticket_id, status):
-        return db.petitions.update_one(
-            {'ticket_id': ticket_id},
+        current = db.petitions.find_one({'ticket_id': ticket_id}, {'department': 1, 'status': 1})
+        if not current:
+            return db.petitions.update_one(
+                {'ticket_id': ticket_id},
+                {'$set': {'status': status, 'updated_at': datetime.now(UTC)}}
+            )
+        
+        # Only apply the change if nobody moved the petition since we read it,
+        # so the counters see every transition exactly once
+        result = db.petitions.update_one(
+            {'ticket_id': ticket_id, 'status': current.get('status')},
             {'$set': {'status': status, 'updated_at': datetime.now(UTC)}}
-        )
\ No newline at end of file
+        )
+        if result.modified_count > 0:
+            move_status(db, current.get('department'), current.get('status'), status)
+        return result
@@ -0,0 +1,285 @@
+"""
+Department notifications stored in MongoDB, and the live event stream behind them
+"""
+import json
+import os
+import queue
+import threading
+from datetime import datetime, UTC, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from config import Config
+from database import db as default_db
+from models import apply_cursor, next_cursor
+
+# Read notifications are removed by a TTL index this long after they are created;
+# unread ones are kept so the unread counters never drift
+NOTIFICATION_RETENTION = timedelta(days=getattr(Config, 'NOTIFICATION_RETENTION_DAYS', 30))
+
+NOTIFICATION_PAGE_SIZE = 50
+
+NOTIFICATION_SORT = [('timestamp', -1), ('_id', -1)]
+
+# Events stay replayable (for Last-Event-ID) this long
+EVENT_RETENTION = timedelta(days=1)
+
+
+def serialize_notification(notification):
+    """JSON shape the dashboards expect"""
+    return {
+        'id': str(notification['_id']),
+        'ticket_id': notification.get('ticket_id'),
+        'title': notification.get('title'),
+        'department': notification.get('department'),
+        'urgency': notification.get('urgency'),
+        'type': notification.get('type'),
+        'status': notification.get('status'),
+        'timestamp': notification['timestamp'].replace(tzinfo=UTC).isoformat(),
+        'read': notification.get('read', False)
+    }
+
+
+def create_notification(db, department, notification_type, ticket_id, title, urgency=None, **fields):
+    """Store an unread notification for `department` and return it"""
+    notification = {
+        'department': department,
+        'type': notification_type,
+        'ticket_id': ticket_id,
+        'title': title,
+        'urgency': urgency,
+        'timestamp': datetime.now(UTC),
+        'read': False
+    }
+    notification.update(fields)
+    result = db.notifications.insert_one(notification)
+    notification['_id'] = result.inserted_id
+    _add_unread(db, department, 1)
+    publish_event(db, department, notification_type, serialize_notification(notification))
+    return notification
+
+
+def publish_event(db, department, event_type, data):
+    """Record an event for `department`'s live streams; the _id is the SSE event id"""
+    result = db.notification_events.insert_one({
+        'department': department,
+        'type': event_type,
+        'data': data,
+        'timestamp': datetime.now(UTC)
+    })
+    broker.wake()
+    return result.inserted_id
+
+
+def list_notifications(db, department, limit=NOTIFICATION_PAGE_SIZE, cursor=None, unread_only=False):
+    """One page of a department's notifications, newest first.
+
+    Returns (notifications, next cursor). Matching `read` on both values lets
+    the (department, read, timestamp, _id) index serve the sort by merging its
+    two ranges instead of sorting in memory.
+    """
+    query = {'department': department, 'read': False if unread_only else {'$in': [False, True]}}
+    results = list(
+        db.notifications.find(apply_cursor(query, cursor, field='timestamp'))
+        .sort(NOTIFICATION_SORT)
+        .limit(limit)
+    )
+    return results, next_cursor(results, limit, field='timestamp')
+
+
+def _add_unread(db, department, amount):
+    if amount:
+        db.notification_counters.update_one({'_id': department}, {'$inc': {'unread': amount}}, upsert=True)
+
+
+def count_unread(db, department):
+    """Unread notifications for `department`, from its counter document"""
+    counter = db.notification_counters.find_one({'_id': department}, {'unread': 1})
+    return max(0, counter.get('unread', 0)) if counter else 0
+
+
+def rebuild_unread_counters(db):
+    """Recompute every department's unread counter from the notifications collection.
+
+    The counters are kept exact by the writes in this module; this repairs
+    them after notifications are changed some other way. Returns the number
+    of departments with unread notifications.
+    """
+    totals = {
+        item['_id']: item['count']
+        for item in db.notifications.aggregate([
+            {'$match': {'read': False}},
+            {'$group': {'_id': '$department', 'count': {'$sum': 1}}}
+        ])
+    }
+    for department, count in totals.items():
+        db.notification_counters.update_one({'_id': department}, {'$set': {'unread': count}}, upsert=True)
+    db.notification_counters.update_many({'_id': {'$nin': list(totals)}}, {'$set': {'unread': 0}})
+    return len(totals)
+
+
+def mark_read(db, department, notification_id):
+    """Mark one of `department`'s notifications read.
+
+    Returns None if there is no such notification for this department,
+    otherwise whether it was unread before.
+    """
+    try:
+        _id = ObjectId(notification_id)
+    except (InvalidId, TypeError):
+        return None
+    before = db.notifications.find_one_and_update(
+        {'_id': _id, 'department': department},
+        {'$set': {'read': True}},
+        projection={'read': 1}
+    )
+    if before is None:
+        return None
+    was_unread = not before.get('read', False)
+    if was_unread:
+        # Only the write that actually flipped the flag decrements the counter
+        _add_unread(db, department, -1)
+    return was_unread
+
+
+def mark_all_read(db, department):
+    """Mark every unread notification of `department` read; returns how many changed"""
+    result = db.notifications.update_many(
+        {'department': department, 'read': False},
+        {'$set': {'read': True}}
+    )
+    # Decrement by what this update flipped; notifications added meanwhile stay counted
+    _add_unread(db, department, -result.modified_count)
+    return result.modified_count
+
+
+class Subscription:
+    """One open stream: a bounded queue of events for a department"""
+
+    def __init__(self, department, maxsize=256):
+        self.department = department
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event, or None if none arrived within `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class NotificationBroker:
+    """Fans events out from the notification_events collection to open streams.
+
+    One thread per process polls the collection for every department at once,
+    so the database load doesn't grow with the number of open dashboards, and
+    events written by any worker reach streams held by every worker.
+    Publishing in this process wakes the poller immediately.
+
+    ObjectIds from different processes aren't strictly ordered, so each poll
+    looks back a few seconds and skips events it has already delivered.
+    """
+
+    LOOKBACK = timedelta(seconds=5)
+
+    def __init__(self, db=None, poll_interval=1.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._lock = threading.Condition()
+        self._subscriptions = set()
+        self._delivered = {}  # event _id -> generation time, within LOOKBACK
+        self._since = None
+        self._thread = None
+        self._pid = None
+        self._woken = False
+
+    def subscribe(self, department):
+        subscription = Subscription(department)
+        with self._lock:
+            self._start()
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscription.closed = True
+            self._subscriptions.discard(subscription)
+
+    def wake(self):
+        with self._lock:
+            self._woken = True
+            self._lock.notify_all()
+
+    def replay(self, department, last_event_id):
+        """Events for `department` after `last_event_id`, oldest first"""
+        try:
+            last_id = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            return []
+        return list(
+            self.db.notification_events.find({'department': department, '_id': {'$gt': last_id}}).sort('_id', 1)
+        )
+
+    def _start(self):
+        # Called with the lock held; a forked worker needs its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._subscriptions = set()
+        self._delivered = {}
+        self._since = datetime.now(UTC) - self.LOOKBACK
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='notification-broker', daemon=True)
+        self._thread.start()
+
+    def _poll(self):
+        events = list(
+            self.db.notification_events.find({'_id': {'$gte': ObjectId.from_datetime(self._since)}}).sort('_id', 1)
+        )
+        now = datetime.now(UTC)
+        self._since = now - self.LOOKBACK
+        cutoff = ObjectId.from_datetime(self._since)
+        self._delivered = {_id: seen for _id, seen in self._delivered.items() if _id >= cutoff}
+
+        fresh = [event for event in events if event['_id'] not in self._delivered]
+        for event in fresh:
+            self._delivered[event['_id']] = now
+        return fresh
+
+    def _dispatch(self, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            for subscription in subscriptions:
+                if subscription.department != event['department'] or subscription.closed:
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # A stalled client; drop it and let it resume with Last-Event-ID
+                    self.unsubscribe(subscription)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._woken:
+                    self._lock.wait(self.poll_interval)
+                self._woken = False
+                idle = not self._subscriptions
+            if idle:
+                # Nobody is listening; don't replay old events to the next subscriber
+                self._since = datetime.now(UTC) - self.LOOKBACK
+                continue
+            try:
+                self._dispatch(self._poll())
+            except Exception as e:
+                print(f"❌ Notification broker poll failed: {str(e)}")
+
+
+def format_event(event):
+    """Server-Sent Events frame for a notification_events document"""
+    return f"id: {event['_id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+broker = NotificationBroker(default_db)
@@ -0,0 +1,102 @@
+"""
+Per-process TTL + LRU cache of user, department and admin documents
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+
+# Never cache credentials or one-time passwords
+SECRET_FIELDS_PROJECTION = {'password': 0, 'otp': 0, 'otp_created_at': 0}
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class PrincipalCache:
+    """Looks up session principals by id, hitting MongoDB at most once per TTL.
+
+    The cache is per process, so invalidation only reaches the worker that
+    handled the write; other workers see the change once their entry expires.
+    Keep the TTL short enough that this staleness is acceptable.
+    """
+
+    COLLECTIONS = {'user': 'users', 'department': 'departments', 'admin': 'admins'}
+
+    def __init__(self, db, maxsize=1024, ttl=30):
+        self.db = db
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _get(self, kind, principal_id):
+        key = (kind, str(principal_id))
+        document = self.cache.get(key)
+        if document is None:
+            collection = self.db[self.COLLECTIONS[kind]]
+            document = collection.find_one({'_id': ObjectId(principal_id)}, SECRET_FIELDS_PROJECTION)
+            if document is None:
+                return None
+            self.cache.set(key, document)
+        # Callers may add keys to what they get back; keep the cached copy clean
+        return dict(document)
+
+    def get_user(self, user_id):
+        return self._get('user', user_id)
+
+    def get_department(self, department_id):
+        return self._get('department', department_id)
+
+    def get_admin(self, admin_id):
+        return self._get('admin', admin_id)
+
+    def invalidate(self, kind, principal_id):
+        self.cache.invalidate((kind, str(principal_id)))
+
+    def invalidate_user(self, user_id):
+        self.invalidate('user', user_id)
+
+    def invalidate_department(self, department_id):
+        self.invalidate('department', department_id)
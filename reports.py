@@ -0,0 +1,188 @@
+"""
+Aggregation pipelines for the daily and weekly department email reports
+"""
+from datetime import datetime, UTC, timedelta
+
+# Petitions listed in each section of the daily summary
+DAILY_LIST_SIZE = 5
+
+LISTED_FIELDS = {'ticket_id': '$ticket_id', 'title': '$title', 'urgency': '$urgency', 'category': '$category'}
+
+
+def _count_if(condition):
+    return {'$sum': {'$cond': [condition, 1, 0]}}
+
+
+def _department_filter(departments):
+    return {} if departments is None else {'department': {'$in': list(departments)}}
+
+
+def _listed(match, sort):
+    """Facet listing the first DAILY_LIST_SIZE matching petitions of each department"""
+    return [
+        {'$match': match},
+        {'$sort': sort},
+        {'$group': {'_id': '$department', 'petitions': {'$push': LISTED_FIELDS}}},
+        {'$project': {'petitions': {'$slice': ['$petitions', DAILY_LIST_SIZE]}}}
+    ]
+
+
+def daily_reports_pipeline(yesterday, departments=None):
+    """One pass producing the daily summary figures for every department.
+
+    The $or keeps the scan to petitions that can count toward some figure:
+    new, recently resolved, pending or open high-urgency ones.
+    """
+    is_new = {'$gte': ['$created_at', yesterday]}
+    open_high = {'urgency': 'high', 'status': {'$ne': 'resolved'}}
+
+    return [
+        {'$match': {
+            **_department_filter(departments),
+            '$or': [
+                {'created_at': {'$gte': yesterday}},
+                {'status': 'pending'},
+                {'status': 'resolved', 'updated_at': {'$gte': yesterday}},
+                open_high
+            ]
+        }},
+        {'$facet': {
+            'counts': [
+                {'$group': {
+                    '_id': '$department',
+                    'new_petitions': _count_if(is_new),
+                    'resolved_today': _count_if({'$and': [
+                        {'$eq': ['$status', 'resolved']},
+                        {'$gte': ['$updated_at', yesterday]}
+                    ]}),
+                    'pending': _count_if({'$eq': ['$status', 'pending']}),
+                    'high_urgency': _count_if({'$and': [
+                        {'$eq': ['$urgency', 'high']},
+                        {'$ne': ['$status', 'resolved']}
+                    ]})
+                }}
+            ],
+            'high_urgency_petitions': _listed(open_high, {'created_at': -1}),
+            'new_today': _listed({'created_at': {'$gte': yesterday}}, {'created_at': 1})
+        }}
+    ]
+
+
+def daily_reports(db, departments=None, now=None):
+    """Daily summary payload for each department, keyed by department name.
+
+    Pass `departments` to limit the run to those names; every listed
+    department gets a payload, even one with no petitions.
+    """
+    now = now or datetime.now(UTC)
+    yesterday = now - timedelta(days=1)
+    result = next(db.petitions.aggregate(daily_reports_pipeline(yesterday, departments)), {})
+
+    counts = {item['_id']: item for item in result.get('counts', [])}
+    high_urgency = {item['_id']: item['petitions'] for item in result.get('high_urgency_petitions', [])}
+    new_today = {item['_id']: item['petitions'] for item in result.get('new_today', [])}
+
+    names = departments if departments is not None else counts.keys()
+    reports = {}
+    for name in names:
+        item = counts.get(name, {})
+        reports[name] = {
+            'department_name': name,
+            'date': now.strftime('%B %d, %Y'),
+            'new_petitions': item.get('new_petitions', 0),
+            'resolved_today': item.get('resolved_today', 0),
+            'pending': item.get('pending', 0),
+            'high_urgency': item.get('high_urgency', 0),
+            'high_urgency_petitions': high_urgency.get(name, []),
+            'new_today': new_today.get(name, [])
+        }
+    return reports
+
+
+def weekly_reports_pipeline(week_ago, two_weeks_ago, departments=None):
+    """One pass over the last two weeks of petitions, totals per department and week"""
+    this_week = {'$gte': ['$created_at', week_ago]}
+
+    def this_week_with(status):
+        return _count_if({'$and': [this_week, {'$eq': ['$status', status]}]})
+
+    return [
+        {'$match': {**_department_filter(departments), 'created_at': {'$gte': two_weeks_ago}}},
+        {'$group': {
+            '_id': '$department',
+            'total': _count_if(this_week),
+            'resolved': this_week_with('resolved'),
+            'in_progress': this_week_with('in_progress'),
+            'pending': this_week_with('pending'),
+            'prev_total': _count_if({'$lt': ['$created_at', week_ago]}),
+            'prev_resolved': _count_if({'$and': [
+                {'$lt': ['$created_at', week_ago]},
+                {'$eq': ['$status', 'resolved']}
+            ]})
+        }}
+    ]
+
+
+def _weekly_insights(total_petitions, prev_total, resolution_rate, prev_resolution_rate, pending):
+    insights = []
+
+    if total_petitions > prev_total:
+        increase_pct = ((total_petitions - prev_total) / prev_total * 100) if prev_total > 0 else 100
+        insights.append(f"Petition volume increased by {increase_pct:.1f}% compared to last week")
+    elif total_petitions < prev_total:
+        decrease_pct = ((prev_total - total_petitions) / prev_total * 100) if prev_total > 0 else 0
+        insights.append(f"Petition volume decreased by {decrease_pct:.1f}% compared to last week")
+
+    if resolution_rate > prev_resolution_rate:
+        insights.append(f"Resolution rate improved by {(resolution_rate - prev_resolution_rate):.1f}%")
+
+    if pending > total_petitions * 0.3:
+        insights.append(f"High number of pending petitions ({pending}) - consider prioritizing")
+
+    if not insights:
+        insights.append("Performance is stable compared to last week")
+    return insights
+
+
+def weekly_reports(db, departments=None, now=None):
+    """Weekly performance payload for each department, keyed by department name"""
+    now = now or datetime.now(UTC)
+    week_ago = now - timedelta(days=7)
+    two_weeks_ago = now - timedelta(days=14)
+    rows = {item['_id']: item for item in db.petitions.aggregate(
+        weekly_reports_pipeline(week_ago, two_weeks_ago, departments)
+    )}
+
+    names = departments if departments is not None else rows.keys()
+    reports = {}
+    for name in names:
+        item = rows.get(name, {})
+        total_petitions = item.get('total', 0)
+        prev_total = item.get('prev_total', 0)
+        resolution_rate = (item.get('resolved', 0) / total_petitions * 100) if total_petitions > 0 else 0
+        prev_resolution_rate = (item.get('prev_resolved', 0) / prev_total * 100) if prev_total > 0 else 0
+        status_breakdown = {
+            'resolved': item.get('resolved', 0),
+            'in_progress': item.get('in_progress', 0),
+            'pending': item.get('pending', 0)
+        }
+
+        reports[name] = {
+            'department_name': name,
+            'week_start': week_ago.strftime('%B %d'),
+            'week_end': now.strftime('%B %d, %Y'),
+            'total_petitions': total_petitions,
+            'petitions_trend': ((total_petitions - prev_total) / prev_total * 100) if prev_total > 0 else 0,
+            'resolution_rate': f"{resolution_rate:.1f}%",
+            'resolution_trend': resolution_rate - prev_resolution_rate,
+            # Mock figures until response times and feedback are recorded
+            'avg_response_time': "2.5 hours",
+            'response_trend': 15,
+            'satisfaction_score': 4.5,
+            'satisfaction_trend': 5,
+            'status_breakdown': status_breakdown,
+            'insights': _weekly_insights(
+                total_petitions, prev_total, resolution_rate, prev_resolution_rate, status_breakdown['pending']
+            )
+        }
+    return reports
@@ -0,0 +1,187 @@
+"""
+Petition search: ranked text search and faceted, paginated filtering
+"""
+import html
+import re
+from datetime import datetime, UTC, timedelta
+
+# Ticket ids look like PET-XXXXXXXX; anything shaped like one (or a prefix of
+# one) is looked up on the unique ticket_id index instead of the text index
+TICKET_PREFIX = re.compile(r'^PET-[A-Z0-9]{0,8}$', re.IGNORECASE)
+
+# Characters of context kept around the first match in a snippet
+SNIPPET_CONTEXT = 80
+
+SEARCH_PAGE_SIZE = 20
+
+
+def is_ticket_prefix(text):
+    return bool(TICKET_PREFIX.match(text))
+
+
+def search_terms(text):
+    """Words of a $text search string, without negations or quote marks"""
+    terms = []
+    for word in re.findall(r'-?\w+', text):
+        if word.startswith('-'):
+            continue
+        terms.append(word.lower())
+    return terms
+
+
+def _term_pattern(terms):
+    # Terms are stemmed by MongoDB, so highlight every word starting with one
+    return re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+
+
+def highlight(text, pattern, context=None):
+    """HTML-escaped `text` with matches wrapped in <mark>.
+
+    With `context`, only the part of `text` around the first match is kept.
+    """
+    if not text:
+        return ''
+    start, end = 0, len(text)
+    if context is not None:
+        match = pattern.search(text)
+        if match:
+            start = max(0, match.start() - context)
+            end = min(len(text), match.end() + context)
+        else:
+            end = min(len(text), 2 * context)
+
+    parts = []
+    position = start
+    for match in pattern.finditer(text, start, end):
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+
+    snippet = ''.join(parts)
+    if start > 0:
+        snippet = '…' + snippet
+    if end < len(text):
+        snippet += '…'
+    return snippet
+
+
+def _ranked_query(query, text):
+    """`query` narrowed to the search `text`: a ticket id prefix, or a $text search"""
+    if is_ticket_prefix(text):
+        # Anchored, case-sensitive prefix: an index range scan on ticket_id
+        return dict(query, ticket_id={'$regex': '^' + re.escape(text.upper())})
+    return dict(query, **{'$text': {'$search': text}})
+
+
+def search_petitions(db, query, text, limit=SEARCH_PAGE_SIZE, page=1, projection=None):
+    """One page of petitions matching `query` and the search `text`, best match first.
+
+    Returns (petitions, total). Each petition carries a `highlights` dict with
+    marked-up title and description snippets for the fields it was returned with.
+    """
+    text = text.strip()
+    skip = (page - 1) * limit
+    query = _ranked_query(query, text)
+
+    if is_ticket_prefix(text):
+        sort = [('ticket_id', 1)]
+        pattern = re.compile(re.escape(text), re.IGNORECASE)
+    else:
+        projection = dict(projection or {}, score={'$meta': 'textScore'})
+        sort = [('score', {'$meta': 'textScore'}), ('created_at', -1), ('_id', -1)]
+        terms = search_terms(text)
+        pattern = _term_pattern(terms) if terms else None
+
+    total = db.petitions.count_documents(query)
+    petitions = list(db.petitions.find(query, projection).sort(sort).skip(skip).limit(limit))
+
+    for petition in petitions:
+        petition.pop('score', None)
+        if pattern is None:
+            continue
+        highlights = {}
+        if 'ticket_id' in petition:
+            highlights['ticket_id'] = highlight(petition['ticket_id'], pattern)
+        if 'title' in petition:
+            highlights['title'] = highlight(petition['title'], pattern)
+        if 'description' in petition:
+            highlights['description'] = highlight(petition['description'], pattern, SNIPPET_CONTEXT)
+        petition['highlights'] = highlights
+
+    return petitions, total
+
+
+def search_facets(db, query, text, fields=('status',)):
+    """Counts per value of each of `fields` across every match of a search_petitions search.
+
+    One aggregation, so a paged search can still report figures for all of
+    its results rather than the page on screen.
+    """
+    stages = {field: [{'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}] for field in fields}
+    result = next(db.petitions.aggregate([
+        {'$match': _ranked_query(query, text.strip())},
+        {'$facet': stages}
+    ]), {})
+    return {
+        field: {item['_id']: item['count'] for item in result.get(field, []) if item['_id'] is not None}
+        for field in fields
+    }
+
+
+# Sort orders accepted by /api/petitions/search, each served by an index:
+# created_at by the (created_at, _id) index, ticket_id by its unique index
+SEARCH_SORTS = {
+    'newest': [('created_at', -1), ('_id', -1)],
+    'oldest': [('created_at', 1), ('_id', 1)],
+    'ticket_id': [('ticket_id', 1)]
+}
+
+SEARCH_FACETS = ('status', 'category', 'urgency', 'department')
+
+
+def parse_date_bound(value, end=False):
+    """UTC datetime for a `date_from`/`date_to` value.
+
+    Dates without a time cover the whole day, so `end=True` returns the last
+    instant of that day. Values without an offset are taken as UTC. Raises
+    ValueError for anything that isn't ISO 8601.
+    """
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        parsed = parsed + timedelta(days=1) - timedelta(milliseconds=1)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=UTC)
+    return parsed.astimezone(UTC)
+
+
+def faceted_search(db, query, sort='newest', limit=SEARCH_PAGE_SIZE, page=1, projection=None):
+    """One page of petitions plus total and per-facet counts, in one aggregation.
+
+    `$match` and `$sort` run before `$facet` so they can use an index; stages
+    inside `$facet` cannot. Returns (petitions, total, facets).
+    """
+    results = [{'$skip': (page - 1) * limit}, {'$limit': limit}]
+    if projection:
+        results.append({'$project': projection})
+
+    stages = {'results': results, 'total': [{'$count': 'count'}]}
+    for field in SEARCH_FACETS:
+        stages[field] = [
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}}
+        ]
+
+    pipeline = [
+        {'$match': query},
+        {'$sort': dict(SEARCH_SORTS[sort])},
+        {'$facet': stages}
+    ]
+    result = next(db.petitions.aggregate(pipeline), {})
+
+    total = (result.get('total') or [{}])[0].get('count', 0)
+    facets = {
+        field: {item['_id']: item['count'] for item in result.get(field, []) if item['_id'] is not None}
+        for field in SEARCH_FACETS
+    }
+    return result.get('results', []), total, facets
@@ -0,0 +1,196 @@
+"""
+Pool of authenticated SMTP connections reused across messages
+"""
+import os
+import smtplib
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Every pool in the process, so a forked child can drop what it inherited
+_pools = weakref.WeakSet()
+
+
+def is_connection_error(error):
+    """True if `error` means the session is unusable, rather than the message refused.
+
+    SMTPException subclasses OSError, so socket errors are told apart from
+    SMTP replies explicitly.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def is_permanent_failure(error):
+    """True if the server refused the message outright, so retrying cannot help"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500 and not isinstance(error, smtplib.SMTPAuthenticationError)
+    return False
+
+
+class PooledConnection:
+    """An authenticated SMTP session and its bookkeeping"""
+
+    def __init__(self, server):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Keeps up to `size` SMTP sessions open and hands them out one sender at a time.
+
+    A connection idle for longer than `max_idle` seconds is checked with NOOP
+    before reuse and replaced if the server has dropped it. Connections are
+    retired after `max_messages` messages, since many servers cap messages
+    per session. After a failed transaction the session is RSET so the next
+    message starts clean.
+
+    A forked child starts with an empty pool of its own, never the parent's
+    open sessions.
+    """
+
+    def __init__(self, host, port, username='', password='', size=3, use_tls=True,
+                 timeout=10, max_idle=60, max_messages=100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self._reset()
+        _pools.add(self)
+
+    def _reset(self):
+        self._idle = []  # most recently used last
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+        self.stats = {'connects': 0, 'reconnects': 0, 'messages': 0}
+
+    def _reset_after_fork(self):
+        # The idle sessions belong to the parent, which may still be using
+        # them: drop them without QUIT, and replace the lock and semaphore,
+        # which may have been held by a parent thread at the fork
+        self._reset()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.stats['connects'] += 1
+        return PooledConnection(server)
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.server.noop()[0] == 250
+        except OSError:
+            return False
+
+    def _checkout(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            return self._connect()
+        if time.monotonic() - connection.last_used > self.max_idle and not self._is_alive(connection):
+            connection.close()
+            with self._lock:
+                self.stats['reconnects'] += 1
+            return self._connect()
+        return connection
+
+    def _checkin(self, connection):
+        connection.last_used = time.monotonic()
+        if self._closed or connection.messages_sent >= self.max_messages:
+            connection.close()
+            return
+        with self._lock:
+            self._idle.append(connection)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session; it is discarded instead of returned if it broke"""
+        self._slots.acquire()
+        connection = None
+        try:
+            connection = self._checkout()
+            yield connection
+        except OSError as e:
+            if connection is not None and not is_connection_error(e):
+                # The message was refused; the session is fine once reset
+                try:
+                    connection.server.rset()
+                except OSError:
+                    connection.close()
+                    connection = None
+            elif connection is not None:
+                connection.close()
+                connection = None
+            raise
+        except Exception:
+            if connection is not None:
+                connection.close()
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._checkin(connection)
+            self._slots.release()
+
+    def send(self, message):
+        """Send an email.message.Message, reconnecting once if the session went stale"""
+        for attempt in (1, 2):
+            try:
+                with self.connection() as connection:
+                    connection.server.send_message(message)
+                    connection.messages_sent += 1
+                with self._lock:
+                    self.stats['messages'] += 1
+                return
+            except OSError as e:
+                if attempt == 2 or not is_connection_error(e):
+                    raise
+                with self._lock:
+                    self.stats['reconnects'] += 1
+
+    def close(self):
+        """Close idle sessions; sessions in use are closed when they are returned"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)